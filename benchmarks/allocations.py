@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import sys
+import tracemalloc
+from osnk.http.server import HTTPServer
+from osnk.http.utils import Headers, Request, parse_head
+from .parse_head import HEAD
+
+
+class Transport:
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def is_closing(self):
+        return False
+
+
+class Writer:
+    def __init__(self):
+        self.transport = Transport()
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def writelines(self, data):
+        for b in data:
+            self.size += len(b)
+
+    async def drain(self):
+        pass
+
+
+def build():
+    server = HTTPServer(host='127.0.0.1', port=0)
+    item = {'id': 1, 'name': 'item', 'tags': ['a', 'b', 'c'], 'price': 9.5}
+
+    @server.route('/api/v1/items')
+    async def items(request):
+        return item, 200, {'Cache-Control': 'no-store',
+                           'X-Page': request.args['page']}
+
+    return server
+
+
+async def exchange(server, writer):
+    reader = asyncio.StreamReader()
+    reader.feed_data(HEAD)
+    reader.feed_eof()
+    head = await reader.readuntil(b'\r\n\r\n')
+    (method, uri, version), headers = parse_head(head[:-4])
+    path, query = uri.split('?', 1)
+    return await server.handle(reader, writer, method, path, query, version,
+                               True, headers)
+
+
+def parse():
+    start, headers = parse_head(HEAD[:-4])
+    method, uri, version = start
+    path, query = uri.split('?', 1)
+    request = Request(None, method, ('http', 'example.com', 8000, path,
+                                     query), headers, b'')
+    request.args
+    return request
+
+
+async def measure(fn, n):
+    results = []
+    tracemalloc.start()
+    try:
+        for _ in range(n):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            r = fn()
+            if asyncio.iscoroutine(r):
+                r = await r
+            current, peak = tracemalloc.get_traced_memory()
+            results.append((peak - before, current - before))
+            del r
+    finally:
+        tracemalloc.stop()
+    results.sort()
+    return results[len(results) // 2]
+
+
+def sizes(request):
+    objects = [('Request', request), ('Headers', request.headers),
+               ('Arguments', request.args)]
+    for name, obj in objects:
+        size = sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            size += sys.getsizeof(obj.__dict__)
+        yield name, size
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=200)
+    args = parser.parse_args(argv)
+    server = build()
+    writer = Writer()
+    for _ in range(10):
+        await exchange(server, writer)
+        parse()
+    headers = parse_head(HEAD[:-4])[1]
+    cases = (('parse + Request', parse),
+             ('Headers copy', lambda: Headers(headers)),
+             ('full exchange', lambda: exchange(server, writer)))
+    for name, fn in cases:
+        peak, retained = await measure(fn, args.number)
+        print('{:<16} peak {:8} bytes  retained {:8} bytes'.format(
+            name, peak, retained))
+    for name, size in sizes(parse()):
+        print('sizeof {:<9} {:8} bytes'.format(name, size))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
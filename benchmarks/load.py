@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import time
+from osnk.http import client
+from osnk.http.server import HTTPServer
+
+routes = 500
+upload_size = 1024 * 1024
+file_size = 8 * 1024 * 1024
+
+scenarios = {
+    'json': {'path': '/json'},
+    'file': {'path': '/file'},
+    'upload': {'path': '/upload', 'method': 'POST'},
+    'routes': {'path': '/r{}/42'.format(routes - 1)},
+    'keep-alive': {'path': '/ping'},
+    'new-connection': {'path': '/ping', 'pool': False},
+}
+
+
+def build(port, root):
+    server = HTTPServer(host='127.0.0.1', port=port)
+    item = {'id': 1, 'name': 'item', 'tags': ['a', 'b', 'c'], 'price': 9.5}
+
+    @server.route('/ping')
+    async def ping(request):
+        return 'pong'
+
+    @server.route('/json')
+    async def small_json(request):
+        return item
+
+    @server.route('/file')
+    async def large_file(request):
+        return root / 'large.bin'
+
+    @server.route('/upload', methods=['POST'], stream=True)
+    async def upload(request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        return {'size': size}
+
+    for i in range(routes):
+        @server.route(r'/r{}/(\d+)'.format(i))
+        async def route(request, n, i=i):
+            return {'route': i, 'n': int(n)}
+
+    return server
+
+
+def serve(port, root):
+    build(port, pathlib.Path(root)).serve()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), 0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('server did not start on port {}'.format(port))
+
+
+def rss(pid=None):
+    try:
+        with open('/proc/{}/status'.format(pid or 'self')) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    i = min(len(values) - 1, max(0, int(round(q * len(values))) - 1))
+    return values[i]
+
+
+async def load(url, method='GET', data=None, pool=True, concurrency=32,
+               duration=5, warmup=1):
+    pool = client.ClientPool(limit_per_host=concurrency) if pool else False
+    latencies = []
+    errors = 0
+    requests = 0
+
+    async def worker(deadline, record):
+        nonlocal errors, requests
+        while time.perf_counter() < deadline:
+            t = time.perf_counter()
+            try:
+                async with client.request(url, method=method, data=data,
+                                          pool=pool) as resp:
+                    ok = resp.status == 200
+            except (OSError, asyncio.IncompleteReadError):
+                ok = False
+            if record:
+                latencies.append(time.perf_counter() - t)
+                requests += 1
+                errors += not ok
+
+    for seconds, record in ((warmup, False), (duration, True)):
+        if not seconds:
+            continue
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(*[worker(deadline, record)
+                               for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    if pool:
+        pool.close()
+    latencies.sort()
+    result = {
+        'requests': requests,
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': requests / elapsed if elapsed else 0,
+    }
+    for name, q in (('p50_ms', 0.5), ('p99_ms', 0.99), ('p999_ms', 0.999)):
+        value = percentile(latencies, q)
+        result[name] = None if value is None else value * 1000
+    return result
+
+
+def run_scenario(name, root, concurrency, duration, warmup):
+    scenario = scenarios[name]
+    port = free_port()
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=serve, args=(port, str(root)))
+    process.start()
+    try:
+        wait_for_port(port)
+        data = b'x' * upload_size if scenario.get('method') == 'POST' \
+            else None
+        url = 'http://127.0.0.1:{}{}'.format(port, scenario['path'])
+        result = asyncio.run(load(url, scenario.get('method', 'GET'), data,
+                                  scenario.get('pool', True), concurrency,
+                                  duration, warmup))
+        result['server_rss_kb'] = rss(process.pid)
+    finally:
+        process.terminate()
+        process.join(10)
+    result['scenario'] = name
+    return result
+
+
+def compare(results, baseline):
+    previous = {r['scenario']: r for r in baseline['results']}
+    lines = []
+    for r in results:
+        old = previous.get(r['scenario'])
+        if not old or not old['rps']:
+            continue
+        lines.append('{:<16} rps {:+7.1f}%  p99 {:+7.1f}%'.format(
+            r['scenario'], (r['rps'] / old['rps'] - 1) * 100,
+            (r['p99_ms'] / old['p99_ms'] - 1) * 100
+            if r['p99_ms'] and old['p99_ms'] else 0.0))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=', '.join(scenarios))
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=5)
+    parser.add_argument('-w', '--warmup', type=float, default=1)
+    parser.add_argument('-o', '--output')
+    parser.add_argument('--compare')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in scenarios]
+    if unknown:
+        parser.error('unknown scenario: {}'.format(', '.join(unknown)))
+    with tempfile.TemporaryDirectory() as tmp:
+        root = pathlib.Path(tmp)
+        (root / 'large.bin').write_bytes(os.urandom(file_size))
+        results = []
+        for name in args.scenarios or scenarios:
+            r = run_scenario(name, root, args.concurrency, args.duration,
+                             args.warmup)
+            results.append(r)
+            print('{:<16} {:10.1f} req/s  p50 {:7.2f} ms  p99 {:7.2f} ms  '
+                  'p999 {:7.2f} ms  errors {}  rss {} KiB'.format(
+                      name, r['rps'], r['p50_ms'] or 0, r['p99_ms'] or 0,
+                      r['p999_ms'] or 0, r['errors'], r['server_rss_kb']),
+                  file=sys.stderr)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'timestamp': time.time(),
+        'client_rss_kb': rss(),
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(results, json.load(f)):
+                print(line, file=sys.stderr)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
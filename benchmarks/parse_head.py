@@ -0,0 +1,71 @@
+import asyncio
+import time
+from osnk.http.utils import Headers, parse_head
+
+HEAD = (b'GET /api/v1/items?page=2 HTTP/1.1\r\n'
+        b'Host: example.com:8000\r\n'
+        b'User-Agent: Mozilla/5.0 (X11; Linux x86_64) Gecko/20100101\r\n'
+        b'Accept: application/json, text/plain, */*\r\n'
+        b'Accept-Language: en-US,en;q=0.5\r\n'
+        b'Accept-Encoding: gzip, deflate\r\n'
+        b'Authorization: Bearer 0123456789abcdef\r\n'
+        b'Connection: keep-alive\r\n'
+        b'Cookie: session=abcdef; theme=dark\r\n'
+        b'Cache-Control: no-cache\r\n'
+        b'Content-Length: 0\r\n'
+        b'\r\n')
+
+
+async def legacy(reader):
+    first = await reader.readline()
+    first.decode().split(' ')
+    raw_headers = []
+    async for line in reader:
+        line = line.strip()
+        if not line:
+            break
+        header = line.decode().split(':', 1)
+        if len(header) == 2:
+            name, value = header
+            name = name.strip()
+            value = value.strip()
+            try:
+                value = int(value)
+            except ValueError:
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+            raw_headers.append((name, value))
+    headers = Headers(raw_headers)
+    return headers['Content-Length'], headers['Host']
+
+
+async def current(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    start, headers = parse_head(head[:-4])
+    return headers['Content-Length'], headers.get_str('Host')
+
+
+async def measure(fn, n):
+    t = time.perf_counter()
+    for _ in range(n):
+        reader = asyncio.StreamReader()
+        reader.feed_data(HEAD)
+        reader.feed_eof()
+        await fn(reader)
+    return (time.perf_counter() - t) / n
+
+
+async def main(n=20000):
+    for fn in (legacy, current):
+        await measure(fn, n // 10)
+    before = await measure(legacy, n)
+    after = await measure(current, n)
+    print('legacy  {:8.2f} us/request'.format(before * 1e6))
+    print('current {:8.2f} us/request'.format(after * 1e6))
+    print('speedup {:8.2f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,394 @@
+import collections
+import email.utils
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import time
+from .files import run
+from .utils import ContentStream, Headers, http_date, unpack_response
+
+
+def parse_http_date(value):
+    try:
+        parsed = email.utils.parsedate_to_datetime(str(value))
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    return parsed.timestamp()
+
+
+coding_suffixes = '-gzip"', '-deflate"'
+
+
+def strip_coding(etag):
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for suffix in coding_suffixes:
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def matching_etag(etag, header):
+    if etag is None:
+        return None
+    if isinstance(header, (list, tuple)):
+        header = ','.join(str(h) for h in header)
+    tags = [t.strip() for t in str(header).split(',')]
+    if '*' in tags:
+        return etag
+    weak = strip_coding(etag)
+    for t in tags:
+        if strip_coding(t) == weak:
+            return t
+    return None
+
+
+def etag_matches(etag, header):
+    return matching_etag(etag, header) is not None
+
+
+class CacheEntry:
+    validators = 'ETag', 'Last-Modified', 'Cache-Control', 'Expires', 'Vary'
+
+    def __init__(self, content, status, headers, expires):
+        self.content = content
+        self.status = status
+        self.headers = headers
+        self.expires = expires
+        self.etag = headers.get_str('ETag')
+        self.last_modified = parse_http_date(headers.get_str('Last-Modified'))
+        self.size = len(content) + sum(len(str(v)) + len(k)
+                                       for k, v in headers)
+
+    def not_modified(self, request_headers):
+        if 'If-None-Match' in request_headers:
+            return etag_matches(self.etag, request_headers['If-None-Match'])
+        if 'If-Modified-Since' in request_headers and \
+                self.last_modified is not None:
+            since = parse_http_date(request_headers['If-Modified-Since'])
+            return since is not None and self.last_modified <= since
+        return False
+
+    def response(self, request_headers):
+        if self.not_modified(request_headers):
+            headers = Headers({k: self.headers[k] for k in self.validators
+                               if k in self.headers})
+            if 'If-None-Match' in request_headers:
+                headers['ETag'] = matching_etag(
+                    self.etag, request_headers['If-None-Match'])
+            return None, 304, headers
+        return self.content, self.status, Headers(self.headers)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024,
+                 max_entry_bytes=None, ttl=60, charset='utf-8'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self.ttl = ttl
+        self.charset = charset
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry.size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def store(self, key, resp, ttl=None):
+        content, status, headers = unpack_response(resp)
+        if status != 200:
+            return None
+        headers = Headers(headers)
+        cache_control = headers.get_str('Cache-Control', '').lower()
+        if 'no-store' in cache_control or 'private' in cache_control:
+            return None
+        if isinstance(content, pathlib.Path):
+            return None
+        try:
+            stream = ContentStream(content, self.charset)
+        except ValueError:
+            return None
+        if not isinstance(stream.content, (bytes, bytearray)):
+            return None
+        if 'Content-Type' not in headers and stream.content_type:
+            headers['Content-Type'] = stream.content_type
+        if 'ETag' not in headers:
+            digest = hashlib.sha1(stream.content).hexdigest()
+            headers['ETag'] = '"{}"'.format(digest)
+        if 'Last-Modified' not in headers:
+            headers['Last-Modified'] = http_date()
+        ttl = self.ttl if ttl is None else ttl
+        entry = CacheEntry(bytes(stream.content), status, headers,
+                           time.monotonic() + ttl)
+        if entry.size > self.max_entry_bytes:
+            return entry
+        self.remove(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.entries and (len(self.entries) > self.max_entries or
+                                self.size > self.max_bytes):
+            self.remove(next(iter(self.entries)))
+        return entry
+
+    def _read(self, path):
+        with path.open('rb') as f:
+            if os.fstat(f.fileno()).st_size > self.max_entry_bytes:
+                return None
+            return f.read()
+
+    async def load(self, resp, executor=None):
+        content, status, headers = unpack_response(resp)
+        if status != 200 or not isinstance(content, pathlib.Path):
+            return resp
+        content = await run(executor, self._read, content)
+        if content is None:
+            return resp
+        return content, status, headers
+
+    def __call__(self, ttl=None):
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(request, *args, **options):
+                if request.method not in ('GET', 'HEAD') or \
+                        'Authorization' in request.headers:
+                    return await fn(request, *args, **options)
+                scheme, host, port, path, query = request.url
+                key = path, query, args
+                entry = self.get(key)
+                if entry is None:
+                    resp = await fn(request, *args, **options)
+                    entry = self.store(key, await self.load(resp), ttl)
+                    if entry is None:
+                        return resp
+                return entry.response(request.headers)
+            return wrapper
+        return decorator
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in str(value or '').split(','):
+        name, sep, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def vary_names(headers):
+    return [n.strip().lower() for n in headers.get_str('Vary', '').split(',')
+            if n.strip()]
+
+
+class CachedResponse:
+    def __init__(self, status, headers, content, stored=None, vary=None):
+        self.status = status
+        self.headers = headers
+        self.content = content
+        self.stored = time.time() if stored is None else stored
+        self.vary = vary or {}
+        self.lifetime, self.age = self._freshness(headers)
+        self.size = len(content) + sum(len(str(v)) + len(k)
+                                       for k, v in headers)
+
+    @staticmethod
+    def _freshness(headers):
+        directives = parse_cache_control(headers.get_str('Cache-Control'))
+        age = headers.get_int('Age', 0)
+        if 'no-cache' in directives:
+            return 0, age
+        if 'max-age' in directives:
+            try:
+                return int(directives['max-age']), age
+            except (TypeError, ValueError):
+                return 0, age
+        expires = parse_http_date(headers.get_str('Expires'))
+        if expires is not None:
+            date = parse_http_date(headers.get_str('Date')) or time.time()
+            return max(0, expires - date), age
+        return 0, age
+
+    def matches(self, request_headers):
+        return all(request_headers.get_str(name) == value
+                   for name, value in self.vary.items())
+
+    @property
+    def fresh(self):
+        return time.time() - self.stored + self.age < self.lifetime
+
+    def validators(self):
+        r = {}
+        if 'ETag' in self.headers:
+            r['If-None-Match'] = self.headers.get_str('ETag')
+        if 'Last-Modified' in self.headers:
+            r['If-Modified-Since'] = self.headers.get_str('Last-Modified')
+        return r
+
+    def revalidated(self, headers):
+        merged = Headers(self.headers)
+        for name, value in Headers(
+                {k: v for k, v in headers if k.lower() not in
+                 ('content-length', 'transfer-encoding', 'connection')}):
+            merged[name] = value
+        return CachedResponse(self.status, merged, self.content,
+                              vary=self.vary)
+
+    def dump(self):
+        return {'status': self.status, 'stored': self.stored,
+                'headers': [[k, str(v)] for k, v in self.headers],
+                'vary': self.vary}
+
+    @classmethod
+    def load(cls, meta, content):
+        headers = Headers.parse(
+            ['{}: {}'.format(k, v).encode() for k, v in meta['headers']])
+        return cls(meta['status'], headers, content, meta['stored'],
+                   meta.get('vary'))
+
+
+class DiskStore:
+    suffixes = '.json', '.body', '.tmp'
+
+    def __init__(self, directory, executor=None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.executor = executor
+
+    def _paths(self, key):
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return (self.directory / (name + '.json'),
+                self.directory / (name + '.body'))
+
+    async def get(self, key):
+        return await run(self.executor, self._get, key)
+
+    async def set(self, key, entry):
+        await run(self.executor, self._set, key, entry)
+
+    async def remove(self, key):
+        await run(self.executor, self._remove, key)
+
+    async def clear(self):
+        await run(self.executor, self._clear)
+
+    def _get(self, key):
+        meta_path, body_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            content = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if meta.get('key') != key:
+            return None
+        return CachedResponse.load(meta, content)
+
+    def _set(self, key, entry):
+        meta_path, body_path = self._paths(key)
+        meta = entry.dump()
+        meta['key'] = key
+        for path, data in ((body_path, entry.content),
+                           (meta_path, json.dumps(meta).encode())):
+            tmp = path.with_suffix(path.suffix + '.tmp')
+            tmp.write_bytes(data)
+            os.replace(str(tmp), str(path))
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _clear(self):
+        for path in self.directory.iterdir():
+            if path.suffix in self.suffixes:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+class ClientCache:
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024,
+                 directory=None, executor=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = DiskStore(directory, executor) if directory else None
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+    async def get(self, key, request_headers=None):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.store:
+            entry = await self.store.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None or not entry.matches(Headers(request_headers)):
+            return None
+        return entry
+
+    def _remember(self, key, entry):
+        self._forget(key)
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.entries and (len(self.entries) > self.max_entries or
+                                self.size > self.max_bytes):
+            self._forget(next(iter(self.entries)))
+
+    def _forget(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    async def set(self, key, status, headers, content, request_headers=None):
+        directives = parse_cache_control(headers.get_str('Cache-Control'))
+        names = vary_names(headers)
+        if status != 200 or 'no-store' in directives or '*' in names:
+            await self.remove(key)
+            return None
+        request_headers = Headers(request_headers)
+        vary = {name: request_headers.get_str(name) for name in names}
+        entry = CachedResponse(status, Headers(headers), bytes(content),
+                               vary=vary)
+        if not entry.lifetime and not entry.validators():
+            return None
+        await self.update(key, entry)
+        return entry
+
+    async def update(self, key, entry):
+        self._remember(key, entry)
+        if self.store:
+            await self.store.set(key, entry)
+
+    async def remove(self, key):
+        self._forget(key)
+        if self.store:
+            await self.store.remove(key)
+
+    async def clear(self):
+        self.entries.clear()
+        self.size = 0
+        if self.store:
+            await self.store.clear()
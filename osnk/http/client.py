@@ -1,15 +1,171 @@
 import asyncio
-import re
+import collections
+import pathlib
+import random
 import ssl
+import time
 import urllib.parse
-from .utils import Headers, Response
+from .codec import default_codec, get_codec
+from .compression import decompressor
+from .utils import Body, Headers, Response, parse_head
 
 
-class RequestContextManager:
-    first_line = re.compile(r'([^ ]+) ([^ ]+)')
+class Connection:
+    def __init__(self, key, reader, writer, loop):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.expires = None
+        self.reused = False
+
+    def is_usable(self, loop):
+        if self.loop is not loop:
+            return False
+        if self.writer.transport.is_closing() or self.reader.at_eof():
+            return False
+        return self.expires is None or loop.time() < self.expires
+
+    def close(self):
+        if not self.loop.is_closed():
+            self.writer.close()
+
+
+async def connect(scheme, host, port):
+    if scheme == 'https':
+        sc = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        reader, writer = await asyncio.open_connection(host, port, ssl=sc)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    return Connection((scheme, host, port), reader, writer,
+                      asyncio.get_event_loop())
+
+
+class ClientPool:
+    def __init__(self, *, limit_per_host=10, keep_alive_timeout=15,
+                 max_idle_per_host=None, evict_interval=1):
+        self.limit_per_host = limit_per_host
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.evict_interval = evict_interval
+        self._evicted = time.monotonic()
+        self._idle = {}
+        self._active = collections.Counter()
+        self._waiters = {}
+        self.connects = 0
+        self.reuses = 0
+
+    async def acquire(self, scheme, host, port):
+        key = scheme, host, port
+        loop = asyncio.get_event_loop()
+        while self.limit_per_host and \
+                self._active[key] >= self.limit_per_host:
+            waiter = loop.create_future()
+            self._waiters.setdefault(key, collections.deque()).append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wakeup(key)
+                raise
+        self._active[key] += 1
+        try:
+            self._maybe_evict()
+            idle = self._idle.get(key)
+            while idle:
+                conn = idle.pop()
+                if conn.is_usable(loop):
+                    conn.reused = True
+                    self.reuses += 1
+                    return conn
+                conn.close()
+            conn = await connect(scheme, host, port)
+            self.connects += 1
+            return conn
+        except BaseException:
+            self._decrement(key)
+            self._wakeup(key)
+            raise
+
+    def _decrement(self, key):
+        self._active[key] -= 1
+        if self._active[key] <= 0:
+            del self._active[key]
+
+    def release(self, conn, reusable=True):
+        key = conn.key
+        self._decrement(key)
+        if reusable and conn.is_usable(conn.loop):
+            idle = self._idle.setdefault(key, collections.deque())
+            if self.keep_alive_timeout is not None:
+                conn.expires = conn.loop.time() + self.keep_alive_timeout
+            idle.append(conn)
+            while self.max_idle_per_host and \
+                    len(idle) > self.max_idle_per_host:
+                idle.popleft().close()
+        else:
+            conn.close()
+        self._wakeup(key)
+        self._maybe_evict()
+
+    def _wakeup(self, key):
+        waiters = self._waiters.get(key)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                try:
+                    waiter.set_result(None)
+                except RuntimeError:
+                    continue
+                break
+        if not waiters:
+            self._waiters.pop(key, None)
+
+    def _maybe_evict(self):
+        now = time.monotonic()
+        if self.evict_interval is not None and \
+                now - self._evicted >= self.evict_interval:
+            self._evicted = now
+            self.evict()
+
+    def evict(self):
+        loop = asyncio.get_event_loop()
+        for key, idle in list(self._idle.items()):
+            for conn in list(idle):
+                if not conn.is_usable(loop):
+                    idle.remove(conn)
+                    conn.close()
+            if not idle:
+                del self._idle[key]
+
+    def stats(self):
+        return {'active': sum(self._active.values()),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'waiting': sum(len(w) for w in self._waiters.values()),
+                'connects': self.connects,
+                'reuses': self.reuses}
+
+    def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+default_pool = ClientPool()
+idempotent = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'))
 
+
+class RequestContextManager:
     def __init__(self, url, *, method='GET', headers=None, data=None,
-                 json=None, newline=b'\r\n', charset='utf-8'):
+                 json=None, newline=b'\r\n', charset='utf-8', pool=None,
+                 cache=None, decompress=True, stream=False, codec=None):
         self.url = url
         self.method = method
         self.headers = headers
@@ -17,20 +173,47 @@ class RequestContextManager:
         self.json = json
         self.newline = newline
         self.charset = charset
+        self.pool = default_pool if pool is None else pool
+        self.cache = cache
+        self.decompress = decompress
+        self.stream = stream
+        self.codec = default_codec if codec is None else get_codec(codec)
+        self.conn = None
+        self.response = None
+        self.reusable = False
+
+    async def _connect(self, scheme, host, port):
+        if self.pool:
+            self.conn = await self.pool.acquire(scheme, host, port)
+        else:
+            self.conn = await connect(scheme, host, port)
+        self.writer = self.conn.writer
+        return self.conn.reader, self.conn.writer
+
+    def _release(self, reusable):
+        conn, self.conn = self.conn, None
+        if not conn:
+            return
+        if self.pool:
+            self.pool.release(conn, reusable)
+        else:
+            conn.close()
 
     async def __aenter__(self):
+        try:
+            return await self._request()
+        except BaseException:
+            self._release(False)
+            raise
+
+    async def _request(self):
         parsed = urllib.parse.urlparse(self.url)
         if parsed.scheme not in ['http', 'https']:
             raise ValueError('Available protocols are only HTTP or HTTPS')
         elif parsed.scheme == 'https':
             port = parsed.port or 443
-            sc = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
-            reader, self.writer = await asyncio.open_connection(
-                parsed.hostname, port, ssl=sc)
         else:
             port = parsed.port or 80
-            reader, self.writer = await asyncio.open_connection(
-                parsed.hostname, port)
         path = parsed.path or '/'
         if self.data:
             if isinstance(self.data, (bytes, bytearray)):
@@ -39,90 +222,226 @@ class RequestContextManager:
             else:
                 content_type = 'application/x-www-form-urlencoded'
                 content = urllib.parse.urlencode(self.data).encode(self.charset)
+        elif self.json is not None:
+            content_type = 'application/json'
+            content = self.codec.dumps(self.json)
         else:
             content_type = None
             content = None
         request_headers = Headers({'User-Agent': 'Unknown'})
         if content_type:
             request_headers['Content-Type'] = content_type
+        if self.decompress:
+            request_headers['Accept-Encoding'] = 'gzip, deflate'
         for k, v in Headers(self.headers):
             request_headers[k] = v
+        cache = self.cache is not None and self.method == 'GET' and \
+            'Authorization' not in request_headers
+        cached = None
+        if cache:
+            cached = await self.cache.get(self.url, request_headers)
+            if cached is not None and cached.fresh:
+                return Response(None, None, cached.status,
+                                Headers(cached.headers), cached.content,
+                                from_cache=True, codec=self.codec)
+        if cached is not None:
+            for k, v in cached.validators().items():
+                if k not in request_headers:
+                    request_headers[k] = v
         request_headers['Host'] = parsed.hostname
         if content:
             request_headers['Content-Length'] = len(content)
+        if not self.pool:
+            request_headers['Connection'] = 'close'
         target = path + ('?' + parsed.query if parsed.query else '')
         first = '{} {} HTTP/1.1'.format(self.method, target)
-        self.writer.write(first.encode(self.charset))
-        self.writer.write(self.newline)
+        head = [first.encode(self.charset), self.newline]
         for name, value in request_headers:
-            self.writer.write(name.encode(self.charset))
-            self.writer.write(': '.encode(self.charset))
-            self.writer.write(str(value).encode(self.charset))
-            self.writer.write(self.newline)
-        self.writer.write(self.newline)
+            head.append(name.encode(self.charset))
+            head.append(': '.encode(self.charset))
+            head.append(str(value).encode(self.charset))
+            head.append(self.newline)
+        head.append(self.newline)
         if content:
-            self.writer.write(content)
-        await self.writer.drain()
-        first = await reader.readline()
-        m = self.first_line.search(first.decode())
-        if m:
-            version, status = m.groups()
+            head.append(content)
+        while True:
+            reader, writer = await self._connect(parsed.scheme,
+                                                 parsed.hostname, port)
+            reused = self.conn.reused
+            try:
+                writer.writelines(head)
+                await writer.drain()
+                data = await reader.readuntil(b'\r\n\r\n')
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                data = b''
+            if data or not reused:
+                break
+            self._release(False)
+        start, response_headers = parse_head(data[:-4], self.charset)
+        if len(start) >= 2:
+            version, status = start[:2]
             status = int(status)
-            response_headers = {}
-            async for line in reader:
-                line = line.strip()
-                if not line:
-                    break
-                header = line.decode().split(':')
-                if len(header) == 2:
-                    name, value = header
-                    name = name.strip()
-                    key = name.lower()
-                    value = value.strip()
-                    try:
-                        value = int(value)
-                    except ValueError:
-                        try:
-                            value = float(value)
-                        except ValueError:
-                            pass
-                    if key in response_headers:
-                        if isinstance(response_headers[key], list):
-                            response_headers[key].append(value)
-                        else:
-                            response_headers[key] = [response_headers[key], value]
-                    else:
-                        response_headers[key] = value
-            response_headers = Headers(response_headers)
-            if 'Content-Length' in response_headers:
-                if isinstance(response_headers['Content-Length'], tuple):
-                    content_length = response_headers['Content-Length'][0]
-                else:
-                    content_length = response_headers['Content-Length']
+            transfer_encoding = response_headers.get_str(
+                'Transfer-Encoding', '').lower()
+            if self.method == 'HEAD' or status in (204, 304) or \
+                    100 <= status < 200:
+                body = None
+            elif 'chunked' in transfer_encoding:
+                body = Body(reader, chunked=True)
+            elif 'Content-Length' in response_headers:
+                body = Body(reader,
+                            response_headers.get_int('Content-Length', 0))
             else:
-                content_length = 0
-            response_content = bytearray()
-            if isinstance(content_length, int):
-                chunk = 1024
-                while len(response_content) < content_length:
-                    response_content.extend(await reader.read(chunk))
-            return Response(reader, self.writer, status, response_headers,
-                            response_content)
+                body = Body(reader, None)
+            decoder = None
+            if self.decompress and body is not None:
+                decoder = decompressor(
+                    response_headers.get_str('Content-Encoding'))
+            self.reusable = version.upper() == 'HTTP/1.1' and \
+                (body is None or body.length is not None or body.chunked)
+            if 'Connection' in response_headers:
+                connection = str(response_headers['Connection']).lower()
+                self.reusable = self.reusable and connection != 'close'
+            if cached is not None and status == 304:
+                cached = cached.revalidated(response_headers)
+                await self.cache.update(self.url, cached)
+                return Response(reader, self.writer, cached.status,
+                                Headers(cached.headers), cached.content,
+                                from_cache=True, codec=self.codec)
+            self.response = Response(reader, self.writer, status,
+                                     response_headers, body=body,
+                                     decoder=decoder, codec=self.codec)
+            if not self.stream or cache:
+                content = await self.response.read()
+            if cache:
+                stored = response_headers
+                if decoder or body is not None and body.chunked:
+                    stored = Headers(response_headers)
+                    if decoder:
+                        del stored['Content-Encoding']
+                    if 'Transfer-Encoding' in stored:
+                        del stored['Transfer-Encoding']
+                    stored['Content-Length'] = len(content)
+                await self.cache.set(self.url, status, stored, content,
+                                     request_headers)
+            return self.response
 
     async def __aexit__(self, exc_type, exc, tb):
-        self.writer.close()
+        consumed = self.response is None or self.response.consumed
+        self._release(self.reusable and consumed and exc_type is None)
 
 
 def request(*args, **kwargs):
     return RequestContextManager(*args, **kwargs)
 
 
-def get(url, *, headers=None):
-    return request(url, headers=headers)
+def get(url, *, headers=None, pool=None, cache=None, stream=False):
+    return request(url, headers=headers, pool=pool, cache=cache,
+                   stream=stream)
+
+
+def post(url, *, headers=None, data=None, json=None, pool=None,
+         stream=False):
+    return request(url, method='POST', headers=headers, data=data, json=json,
+                   pool=pool, stream=stream)
+
 
+def delete(url, *, pool=None):
+    return request(url, method='DELETE', pool=pool)
 
-def post(url, *, headers=None, data=None):
-    return request(url, method='POST', headers=headers, data=data)
 
-def delete(url):
-    return request(url, method='DELETE')
+def get_range(url, start=0, end=None, *, headers=None, if_range=None,
+              pool=None, stream=False):
+    headers = Headers(headers)
+    headers['Range'] = 'bytes={}-{}'.format(start, '' if end is None else end)
+    if if_range:
+        headers['If-Range'] = if_range
+    return request(url, headers=headers, pool=pool, decompress=False,
+                   stream=stream)
+
+
+async def download(url, path, *, resume=True, headers=None, if_range=None,
+                   pool=None):
+    path = pathlib.Path(path)
+    offset = path.stat().st_size if resume and path.exists() else 0
+    if offset:
+        context = get_range(url, offset, headers=headers, if_range=if_range,
+                            pool=pool, stream=True)
+    else:
+        context = request(url, headers=headers, pool=pool, decompress=False,
+                          stream=True)
+    async with context as resp:
+        if resp.status == 416 and offset:
+            content_range = resp.headers.get_str('Content-Range', '')
+            if content_range == 'bytes */{}'.format(offset):
+                return resp
+        if resp.status == 206 and resp.headers.get_str(
+                'Content-Range', '').startswith('bytes {}-'.format(offset)):
+            mode = 'ab'
+        elif resp.status == 200:
+            mode = 'wb'
+        else:
+            return resp
+        await resp.save_to(path, mode)
+        return resp
+
+
+async def fetch_many(requests, *, concurrency=100, per_host=10, timeout=None,
+                     retries=2, backoff=0.1, max_backoff=30,
+                     retry_statuses=(502, 503, 504), pool=None):
+    own_pool = pool is None
+    if own_pool:
+        pool = ClientPool(limit_per_host=per_host)
+    limit = asyncio.Semaphore(concurrency)
+    hosts = {}
+
+    async def attempt(options):
+        async with request(**options) as resp:
+            await resp.read()
+            return resp
+
+    async def fetch(i, options):
+        if isinstance(options, str):
+            options = {'url': options}
+        options = dict(options, pool=pool)
+        method = options.get('method', 'GET').upper()
+        host = urllib.parse.urlsplit(options['url']).netloc
+        semaphore = hosts.setdefault(host, asyncio.Semaphore(per_host))
+        tries = retries + 1 if method in idempotent else 1
+        for n in range(tries):
+            delay = min(backoff * 2 ** n * random.uniform(0.5, 1.5),
+                        max_backoff)
+            try:
+                async with limit, semaphore:
+                    if timeout is None:
+                        resp = await attempt(options)
+                    else:
+                        resp = await asyncio.wait_for(attempt(options),
+                                                      timeout)
+            except (OSError, asyncio.TimeoutError,
+                    asyncio.IncompleteReadError) as e:
+                if n == tries - 1:
+                    return i, None, e
+            except Exception as e:
+                return i, None, e
+            else:
+                retry_after = resp.headers.get_int('Retry-After', 0)
+                if resp.status not in retry_statuses or n == tries - 1 or \
+                        retry_after > max_backoff:
+                    return i, resp, None
+                delay = max(delay, retry_after)
+            await asyncio.sleep(delay)
+
+    loop = asyncio.get_event_loop()
+    tasks = [loop.create_task(fetch(i, options))
+             for i, options in enumerate(requests)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+        if own_pool:
+            pool.close()
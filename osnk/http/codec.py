@@ -0,0 +1,98 @@
+import itertools
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONCodec:
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    name = 'orjson'
+
+    def dumps(self, obj):
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().dumps(obj)
+        if b'null' in data:
+            return super().dumps(obj)
+        return data
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    name = 'ujson'
+
+    def dumps(self, obj):
+        try:
+            return ujson.dumps(obj).encode()
+        except (OverflowError, TypeError, ValueError):
+            return super().dumps(obj)
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+codecs = {'json': (JSONCodec, json), 'orjson': (OrjsonCodec, orjson),
+          'ujson': (UjsonCodec, ujson)}
+
+
+def get_codec(codec=None):
+    if codec is None:
+        for name in 'orjson', 'ujson', 'json':
+            cls, module = codecs[name]
+            if module is not None:
+                return cls()
+    if not isinstance(codec, str):
+        return codec
+    if codec not in codecs:
+        m = "unknown codec '{}' (available: {})"
+        raise ValueError(m.format(codec, ', '.join(codecs)))
+    cls, module = codecs[codec]
+    if module is None:
+        raise ValueError("'{}' is not installed".format(codec))
+    return cls()
+
+
+def estimate_size(obj, limit, sample=32):
+    if isinstance(obj, dict):
+        size = len(obj)
+        nested = sampled = 0
+        for x in itertools.islice(obj.values(), sample):
+            if size + nested >= limit:
+                break
+            sampled += 1
+            if isinstance(x, (dict, list, tuple)):
+                nested += estimate_size(x, limit - size - nested, sample)
+        return size + nested * len(obj) // sampled if sampled else size
+    if isinstance(obj, (list, tuple)) and obj:
+        if isinstance(obj[0], (dict, list, tuple)):
+            nested = estimate_size(obj[0], limit // len(obj), sample)
+            return len(obj) * (1 + nested)
+        return len(obj)
+    return 0
+
+
+def is_large(obj, threshold):
+    return estimate_size(obj, threshold) >= threshold
+
+
+default_codec = get_codec()
@@ -0,0 +1,215 @@
+import asyncio
+import pathlib
+import zlib
+from .files import run
+from .utils import ContentStream
+
+default_types = ('text/', 'application/json', 'application/javascript',
+                 'application/xml', 'image/svg+xml', '+json', '+xml')
+
+
+def parse_accept_encoding(value):
+    codings = {}
+    for part in str(value or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, arg = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    q = float(arg)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate(accept_encoding, available=('gzip', 'deflate')):
+    codings = parse_accept_encoding(accept_encoding)
+    best = None
+    for coding in available:
+        q = codings.get(coding, codings.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = coding, q
+    return best[0] if best else None
+
+
+def compressobj(coding, level=6):
+    wbits = 31 if coding == 'gzip' else 15
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def compress(data, coding, level=6):
+    c = compressobj(coding, level)
+    return c.compress(data) + c.flush()
+
+
+class Decompressor:
+    def __init__(self, coding):
+        self.coding = coding
+        self._decompressor = zlib.decompressobj(47)
+        self._started = False
+
+    def decompress(self, data, max_length=0):
+        try:
+            r = self._decompressor.decompress(data, max_length)
+        except zlib.error:
+            if self._started or self.coding != 'deflate':
+                raise
+            self._decompressor = zlib.decompressobj(-15)
+            r = self._decompressor.decompress(data, max_length)
+        self._started = True
+        return r
+
+    @property
+    def unconsumed_tail(self):
+        return self._decompressor.unconsumed_tail
+
+    def iter_decompress(self, data, max_length):
+        while data:
+            r = self.decompress(data, max_length)
+            data = self.unconsumed_tail
+            if r:
+                yield r
+
+    def flush(self):
+        return self._decompressor.flush()
+
+
+def decompressor(content_encoding):
+    coding = str(content_encoding or '').strip().lower()
+    if coding in ('gzip', 'x-gzip', 'deflate'):
+        return Decompressor(coding)
+    return None
+
+
+class CompressedStream:
+    def __init__(self, stream, coding, level=6, executor_threshold=262144,
+                 executor=None):
+        self.stream = stream
+        self.coding = coding
+        self.content_type = getattr(stream, 'content_type', None)
+        self.content_length = None
+        self.level = level
+        self.executor_threshold = executor_threshold
+        self.executor = executor
+        self._compressor = compressobj(coding, level)
+        self._done = False
+
+    async def __aenter__(self):
+        self._iterator = (await self.stream.__aenter__()).__aiter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stream.__aexit__(exc_type, exc, tb)
+
+    def __aiter__(self):
+        return self
+
+    async def _run(self, fn, data):
+        if len(data) < self.executor_threshold:
+            return fn(data)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, fn, data)
+
+    async def __anext__(self):
+        while not self._done:
+            try:
+                chunk = await self._iterator.__anext__()
+            except StopAsyncIteration:
+                self._done = True
+                return self._compressor.flush()
+            r = await self._run(self._compressor.compress, chunk)
+            if r:
+                return r
+        raise StopAsyncIteration
+
+
+class Compression:
+    def __init__(self, min_size=1024, types=default_types, level=6,
+                 codings=('gzip', 'deflate'), executor_threshold=262144,
+                 precompressed=True, executor=None):
+        self.min_size = min_size
+        self.types = tuple(types)
+        self.level = level
+        self.codings = tuple(codings)
+        self.executor_threshold = executor_threshold
+        self.precompressed = precompressed
+        self.executor = executor
+
+    def compressible(self, content_type):
+        if not content_type:
+            return False
+        content_type = str(content_type).split(';', 1)[0].strip().lower()
+        return any(content_type.startswith(t) or content_type.endswith(t)
+                   for t in self.types)
+
+    def _sibling(self, path, stat=None):
+        sibling = path.with_name(path.name + '.gz')
+        try:
+            mtime = (stat or path.stat()).st_mtime
+            sibling_stat = sibling.stat()
+            if sibling_stat.st_mtime >= mtime:
+                return sibling, sibling_stat
+        except OSError:
+            pass
+        return None, None
+
+    def _vary(self, headers):
+        vary = headers.get_str('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower() and vary != '*':
+            headers['Vary'] = vary + ', Accept-Encoding'
+
+    def _etag(self, headers, coding):
+        etag = headers.get_str('ETag')
+        if etag and etag.endswith('"'):
+            headers['ETag'] = '{}-{}"'.format(etag[:-1], coding)
+
+    async def apply(self, stream, headers, request_headers):
+        if 'Content-Encoding' in headers or not hasattr(stream, '__aiter__'):
+            return stream
+        accept = request_headers.get_str('Accept-Encoding')
+        content = getattr(stream, 'content', None)
+        if self.precompressed and isinstance(content, pathlib.Path) and \
+                negotiate(accept, ('gzip',)):
+            executor = getattr(stream, 'executor', None)
+            sibling, stat = await run(executor or self.executor,
+                                      self._sibling, content,
+                                      getattr(stream, 'stat', None))
+            if sibling is not None:
+                stream = ContentStream(sibling, executor=executor, stat=stat)
+                headers['Content-Length'] = stream.content_length
+                headers['Content-Encoding'] = 'gzip'
+                self._etag(headers, 'gzip')
+                self._vary(headers)
+                return stream
+        if not self.compressible(headers['Content-Type']):
+            return stream
+        length = getattr(stream, 'content_length', None)
+        if length is not None and length < self.min_size:
+            return stream
+        self._vary(headers)
+        coding = negotiate(accept, self.codings)
+        if not coding:
+            return stream
+        headers['Content-Encoding'] = coding
+        self._etag(headers, coding)
+        if isinstance(content, (bytes, bytearray)):
+            if len(content) < self.executor_threshold:
+                data = compress(content, coding, self.level)
+            else:
+                loop = asyncio.get_event_loop()
+                data = await loop.run_in_executor(
+                    self.executor, compress, content, coding, self.level)
+            stream = ContentStream(data)
+            headers['Content-Length'] = stream.content_length
+            return stream
+        if 'Content-Length' in headers:
+            del headers['Content-Length']
+        return CompressedStream(stream, coding, self.level,
+                                self.executor_threshold, self.executor)
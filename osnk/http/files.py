@@ -0,0 +1,213 @@
+import asyncio
+import concurrent.futures
+import os
+import pathlib
+import time
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            thread_name_prefix='osnk-io')
+    return _executor
+
+
+def set_executor(executor):
+    global _executor
+    _executor = executor
+
+
+def run(executor, fn, *args):
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(executor or get_executor(), fn, *args)
+
+
+class AsyncFile:
+    chunk_size = 262144
+
+    def __init__(self, file, executor=None, chunk_size=None, read_ahead=True):
+        self.file = file
+        self.executor = executor
+        self.chunk_size = chunk_size or self.chunk_size
+        self.read_ahead = read_ahead
+        self._pending = None
+
+    @classmethod
+    async def open(cls, path, mode='rb', executor=None, **kwargs):
+        file = await run(executor, open, str(path), mode)
+        return cls(file, executor, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _settle(self):
+        if self._pending is None:
+            return
+        pending, self._pending = self._pending, None
+        chunk = await pending
+        if chunk:
+            await run(self.executor, self.file.seek, -len(chunk), 1)
+
+    async def read(self, size=-1):
+        await self._settle()
+        return await run(self.executor, self.file.read, size)
+
+    async def write(self, data):
+        await self._settle()
+        return await run(self.executor, self.file.write, data)
+
+    async def seek(self, offset, whence=0):
+        await self._settle()
+        return await run(self.executor, self.file.seek, offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    async def close(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            await asyncio.wait([pending])
+        await run(self.executor, self.file.close)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._pending is None:
+            self._pending = run(self.executor, self.file.read,
+                                self.chunk_size)
+        chunk = await self._pending
+        if chunk and self.read_ahead:
+            self._pending = run(self.executor, self.file.read,
+                                self.chunk_size)
+        else:
+            self._pending = None
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+
+class DirectoryIndex:
+    max_attempts = 3
+
+    def __init__(self, root, ttl=5, executor=None):
+        self.root = pathlib.Path(root)
+        self.ttl = ttl
+        self.executor = executor
+        self.entries = {}
+        self.totals = {}
+        self.checked = {}
+        self.generation = 0
+        self._invalidated = set()
+        self._lock = None
+
+    def _scan(self, path):
+        files = {}
+        dirs = []
+        with os.scandir(str(path)) as it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        dirs.append(e.name)
+                    elif e.is_file():
+                        files[e.name] = e.stat().st_size
+                    elif e.is_dir():
+                        files[e.name] = 0
+                except OSError:
+                    pass
+        return files, dirs
+
+    def _drop(self, path):
+        entry = self.entries.pop(path, None)
+        self.totals.pop(path, None)
+        self.checked.pop(path, None)
+        if entry:
+            for name in entry[2]:
+                self._drop(path / name)
+
+    def _refresh(self, path, now):
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            self._drop(path)
+            return 0
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != mtime:
+            try:
+                files, dirs = self._scan(path)
+            except OSError:
+                self._drop(path)
+                return 0
+            if entry:
+                for name in set(entry[2]) - set(dirs):
+                    self._drop(path / name)
+            entry = mtime, files, dirs
+            self.entries[path] = entry
+        total = sum(entry[1].values())
+        for name in entry[2]:
+            child = path / name
+            if self.stale(child, now):
+                total += self._refresh(child, now)
+            else:
+                total += self.totals.get(child, 0)
+        self.totals[path] = total
+        self.checked[path] = now
+        return total
+
+    def stale(self, path, now=None):
+        checked = self.checked.get(path)
+        now = time.monotonic() if now is None else now
+        return checked is None or now - checked > self.ttl
+
+    async def refresh(self, path=None):
+        path = self.root if path is None else pathlib.Path(path)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            total = self.totals.get(path, 0)
+            for _ in range(self.max_attempts):
+                if not self.stale(path):
+                    break
+                generation = self.generation
+                self._invalidated.clear()
+                total = await run(self.executor, self._refresh, path,
+                                  time.monotonic())
+                if generation == self.generation:
+                    break
+                for p in self._invalidated:
+                    self._invalidate(p)
+            return total
+
+    def invalidate(self, path):
+        path = pathlib.Path(path)
+        self.generation += 1
+        if self._lock is not None and self._lock.locked():
+            self._invalidated.add(path)
+        self._invalidate(path)
+
+    def _invalidate(self, path):
+        for p in (path, path.parent):
+            entry = self.entries.get(p)
+            if entry:
+                self.entries[p] = (None,) + entry[1:]
+        for p in (path,) + tuple(path.parents):
+            self.checked.pop(p, None)
+            if p == self.root:
+                break
+
+    async def listing(self, path=None):
+        path = self.root if path is None else pathlib.Path(path)
+        await self.refresh(path)
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        mtime, files, dirs = entry
+        r = list(files.items())
+        r.extend((name, self.totals.get(path / name, 0)) for name in dirs)
+        return sorted(r)
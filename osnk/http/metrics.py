@@ -0,0 +1,205 @@
+import asyncio
+import bisect
+import collections
+import datetime
+import sys
+
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(n, escape(v))
+                          for n, v in zip(names, values)) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': [(b, c) for b, c in self.cumulative()]}
+
+
+class Exchange:
+    def __init__(self, method, path, query, started, bytes_in=0):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.started = started
+        self.parsed = started
+        self.handled = None
+        self.finished = None
+        self.route = None
+        self.status = None
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+
+    @property
+    def target(self):
+        return self.path + '?' + self.query if self.query else self.path
+
+
+class Metrics:
+    pool_counters = 'connects', 'reuses'
+
+    def __init__(self, buckets=default_buckets, prefix='osnk_http'):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.requests = collections.Counter()
+        self.latency = collections.defaultdict(
+            lambda: Histogram(self.buckets))
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.gauges = {}
+        self.pools = {}
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def track_pool(self, pool, name='default'):
+        self.pools[name] = pool
+
+    def observe(self, exchange):
+        route = exchange.route or ''
+        self.requests[route, exchange.method, exchange.status] += 1
+        self.bytes_in += exchange.bytes_in
+        self.bytes_out += exchange.bytes_out
+        handled = exchange.handled or exchange.parsed
+        finished = exchange.finished or handled
+        for phase, value in (('parse', exchange.parsed - exchange.started),
+                             ('handler', handled - exchange.parsed),
+                             ('write', finished - handled),
+                             ('total', finished - exchange.started)):
+            self.latency[route, phase].observe(value)
+
+    def snapshot(self):
+        return {
+            'requests': [{'route': r, 'method': m, 'status': s, 'count': c}
+                         for (r, m, s), c in self.requests.items()],
+            'latency': [dict(route=r, phase=p, **h.snapshot())
+                        for (r, p), h in self.latency.items()],
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'gauges': {name: fn() for name, fn in self.gauges.items()},
+            'pools': {name: pool.stats()
+                      for name, pool in self.pools.items()},
+        }
+
+    def render(self):
+        p = self.prefix
+        lines = ['# TYPE {}_requests_total counter'.format(p)]
+        for (route, method, status), count in sorted(
+                self.requests.items(), key=lambda x: str(x[0])):
+            lines.append('{}_requests_total{} {}'.format(
+                p, labels(('route', 'method', 'status'),
+                          (route, method, status)), count))
+        name = '{}_request_duration_seconds'.format(p)
+        lines.append('# TYPE {} histogram'.format(name))
+        for (route, phase), h in sorted(self.latency.items()):
+            for bound, count in h.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(
+                    name, labels(('route', 'phase', 'le'),
+                                 (route, phase, le)), count))
+            lines.append('{}_sum{} {}'.format(
+                name, labels(('route', 'phase'), (route, phase)), h.sum))
+            lines.append('{}_count{} {}'.format(
+                name, labels(('route', 'phase'), (route, phase)), h.count))
+        for name, value in (('bytes_received_total', self.bytes_in),
+                            ('bytes_sent_total', self.bytes_out)):
+            lines.append('# TYPE {}_{} counter'.format(p, name))
+            lines.append('{}_{} {}'.format(p, name, value))
+        for name, fn in sorted(self.gauges.items()):
+            lines.append('# TYPE {}_{} gauge'.format(p, name))
+            lines.append('{}_{} {}'.format(p, name, fn()))
+        stats = {name: pool.stats() for name, pool in self.pools.items()}
+        keys = sorted(set(k for s in stats.values() for k in s))
+        for key in keys:
+            if key in self.pool_counters:
+                kind, metric = 'counter', key + '_total'
+            else:
+                kind, metric = 'gauge', key
+            lines.append('# TYPE osnk_client_pool_{} {}'.format(metric, kind))
+            for name, s in sorted(stats.items()):
+                lines.append('osnk_client_pool_{}{} {}'.format(
+                    metric, labels(('pool',), (name,)), s.get(key, 0)))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class AccessLog:
+    def __init__(self, stream=None, interval=1.0, max_lines=1024,
+                 executor=None):
+        self.stream = stream
+        self.interval = interval
+        self.max_lines = max_lines
+        self.executor = executor
+        self.lines = []
+        self._task = None
+        self._wakeup = None
+
+    def format(self, exchange):
+        duration = (exchange.finished or exchange.started) - exchange.started
+        return '[{}] "{} {}" {} {} {:.1f}ms\n'.format(
+            datetime.datetime.now(), exchange.method, exchange.target,
+            exchange.status, exchange.bytes_out, duration * 1000)
+
+    def log(self, exchange):
+        self.lines.append(self.format(exchange))
+        if self._task is None:
+            loop = asyncio.get_event_loop()
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        if len(self.lines) >= self.max_lines:
+            self._wakeup.set()
+
+    def _write(self, data):
+        stream = self.stream or sys.stdout
+        stream.write(data)
+        stream.flush()
+
+    async def flush(self):
+        if not self.lines:
+            return
+        data, self.lines = ''.join(self.lines), []
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self._write, data)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.wait([task])
+        await self.flush()
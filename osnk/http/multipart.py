@@ -0,0 +1,245 @@
+import re
+import shutil
+import tempfile
+import urllib.parse
+from .files import run
+from .utils import Arguments, BadRequest, Headers, PayloadTooLarge
+
+_option = re.compile(r';\s*([^\s=;]+)\s*(?:=\s*("(?:[^"\\]|\\.)*"|[^;]*))?')
+_escape = re.compile(r'\\(.)')
+
+
+def parse_options(value):
+    value = str(value or '')
+    main, sep, rest = value.partition(';')
+    options = {}
+    for name, arg in _option.findall(sep + rest):
+        name = name.lower()
+        arg = arg.strip()
+        if arg.startswith('"') and arg.endswith('"') and len(arg) > 1:
+            arg = _escape.sub(r'\1', arg[1:-1])
+        if name.endswith('*'):
+            charset, _, encoded = arg.partition("'")
+            _, _, encoded = encoded.partition("'")
+            try:
+                arg = urllib.parse.unquote(encoded, charset or 'utf-8',
+                                           'strict')
+            except (LookupError, UnicodeDecodeError):
+                continue
+            options[name[:-1]] = arg
+        elif name not in options:
+            options[name] = arg
+    return main.strip().lower(), options
+
+
+class Part:
+    def __init__(self, headers, charset='utf-8', spool_size=1048576):
+        self.headers = headers
+        disposition, options = parse_options(
+            headers.get_str('Content-Disposition'))
+        self.name = options.get('name')
+        self.filename = options.get('filename')
+        content_type, options = parse_options(headers.get_str('Content-Type'))
+        self.content_type = content_type or (
+            'application/octet-stream' if self.is_file else 'text/plain')
+        self.charset = options.get('charset', charset)
+        self.size = 0
+        if self.is_file:
+            self.data = None
+            self.file = tempfile.SpooledTemporaryFile(spool_size)
+        else:
+            self.data = bytearray()
+            self.file = None
+
+    @property
+    def is_file(self):
+        return self.filename is not None
+
+    @property
+    def value(self):
+        if self.data is None:
+            return None
+        return self.data.decode(self.charset)
+
+    async def read(self, executor=None):
+        if self.file is None:
+            return self.data
+        await run(executor, self.file.seek, 0)
+        return await run(executor, self.file.read)
+
+    async def save(self, path, mode='wb', executor=None):
+        await run(executor, self._save, path, mode)
+        return self.size
+
+    def _save(self, path, mode):
+        with open(str(path), mode) as f:
+            if self.file is None:
+                f.write(self.data)
+            else:
+                self.file.seek(0)
+                shutil.copyfileobj(self.file, f)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __repr__(self):
+        return "{}('{}', {}, {}, {})".format(self.__class__.__name__,
+                                             self.name, self.filename,
+                                             self.content_type, self.size)
+
+
+class MultipartParser:
+    chunk_size = 65536
+
+    def __init__(self, stream, boundary, charset='utf-8', spool_size=1048576,
+                 max_part_size=None, max_field_size=1048576, max_size=None,
+                 max_parts=1000, max_header_size=16384, executor=None):
+        if not boundary:
+            raise BadRequest('multipart boundary is required')
+        if isinstance(boundary, str):
+            try:
+                boundary = boundary.encode('latin-1')
+            except UnicodeEncodeError:
+                raise BadRequest('invalid multipart boundary')
+        self.stream = stream
+        self.boundary = boundary
+        self.charset = charset
+        self.spool_size = spool_size
+        self.max_part_size = max_part_size
+        self.max_field_size = max_field_size
+        self.max_size = max_size
+        self.max_parts = max_parts
+        self.max_header_size = max_header_size
+        self.executor = executor
+        self.received = 0
+        self.parts = 0
+        self._buffer = bytearray()
+
+    @classmethod
+    def from_request(cls, request, **options):
+        content_type, params = parse_options(
+            request.headers.get_str('Content-Type'))
+        if content_type != 'multipart/form-data':
+            m = "expected multipart/form-data, got '{}'"
+            raise BadRequest(m.format(content_type))
+        return cls(request.stream(), params.get('boundary'), **options)
+
+    async def _fill(self):
+        chunk = await self.stream.read_chunk(self.chunk_size)
+        if not chunk:
+            raise BadRequest('unexpected end of multipart body')
+        self.received += len(chunk)
+        if self.max_size is not None and self.received > self.max_size:
+            raise PayloadTooLarge(self.received)
+        self._buffer += chunk
+
+    async def _feed(self, part, data):
+        if not data:
+            return
+        part.size += len(data)
+        limit = self.max_part_size if part.is_file else self.max_field_size
+        if limit is not None and part.size > limit:
+            raise PayloadTooLarge(part.size)
+        if part.file is None:
+            part.data += data
+        elif part.size > self.spool_size:
+            await run(self.executor, part.file.write, data)
+        else:
+            part.file.write(data)
+
+    async def _finish(self, part):
+        if part.file is None:
+            part.data = bytes(part.data)
+        elif part.size > self.spool_size:
+            await run(self.executor, part.file.seek, 0)
+        else:
+            part.file.seek(0)
+
+    async def _head(self):
+        buffer = self._buffer
+        while True:
+            end = buffer.find(b'\r\n\r\n')
+            if end >= 0:
+                break
+            if len(buffer) > self.max_header_size:
+                raise PayloadTooLarge(len(buffer))
+            await self._fill()
+        lines = bytes(buffer[2:end]).split(b'\r\n') if end else []
+        del buffer[:end + 4]
+        return Headers.parse(lines, self.charset)
+
+    async def _drain(self):
+        self._buffer.clear()
+        while not self.stream.at_eof:
+            chunk = await self.stream.read_chunk(self.chunk_size)
+            self.received += len(chunk)
+            if self.max_size is not None and self.received > self.max_size:
+                raise PayloadTooLarge(self.received)
+
+    def __aiter__(self):
+        return self._parts()
+
+    async def _parts(self):
+        buffer = self._buffer
+        delimiter = b'--' + self.boundary
+        while True:
+            i = buffer.find(delimiter)
+            if i >= 0:
+                del buffer[:i + len(delimiter)]
+                break
+            del buffer[:max(0, len(buffer) - len(delimiter) + 1)]
+            await self._fill()
+        delimiter = b'\r\n' + delimiter
+        keep = len(delimiter) - 1
+        while True:
+            while len(buffer) < 2:
+                await self._fill()
+            if buffer[:2] == b'--':
+                await self._drain()
+                return
+            while True:
+                i = buffer.find(b'\r\n')
+                if i >= 0:
+                    break
+                if len(buffer) > self.max_header_size:
+                    raise PayloadTooLarge(len(buffer))
+                await self._fill()
+            if buffer[:i].strip(b' \t'):
+                raise BadRequest('malformed multipart boundary')
+            del buffer[:i]
+            self.parts += 1
+            if self.max_parts is not None and self.parts > self.max_parts:
+                raise PayloadTooLarge(self.parts)
+            part = Part(await self._head(), self.charset, self.spool_size)
+            try:
+                while True:
+                    i = buffer.find(delimiter)
+                    if i >= 0:
+                        await self._feed(part, bytes(buffer[:i]))
+                        del buffer[:i + len(delimiter)]
+                        break
+                    if len(buffer) > keep:
+                        await self._feed(part, bytes(buffer[:-keep]))
+                        del buffer[:-keep]
+                    await self._fill()
+                await self._finish(part)
+            except BaseException:
+                part.close()
+                raise
+            yield part
+
+    async def parse(self):
+        fields = []
+        files = []
+        try:
+            async for part in self:
+                if part.is_file:
+                    files.append((part.name, part))
+                else:
+                    fields.append((part.name, part.value))
+        except BaseException:
+            for name, part in files:
+                part.close()
+            raise
+        return Arguments(fields), Arguments(files)
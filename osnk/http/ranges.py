@@ -0,0 +1,171 @@
+import os
+import pathlib
+from .files import run
+from .utils import ContentStream, http_date, is_file, sendfile
+
+
+def parse_range(value, size, max_ranges=16):
+    unit, sep, specs = str(value or '').partition('=')
+    if not sep or unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    count = 0
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        count += 1
+        first, sep, last = (s.strip() for s in spec.partition('-'))
+        if not sep or not (first or last) or \
+                (first and not first.isdigit()) or \
+                (last and not last.isdigit()):
+            return None
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            end = int(last) if last else size - 1
+            ranges.append((start, min(end, size - 1)))
+        elif int(last) > 0 and size > 0:
+            ranges.append((max(0, size - int(last)), size - 1))
+    if not count or count > max_ranges:
+        return None
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = merged[-1][0], max(merged[-1][1], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def content_range(start, end, size):
+    return 'bytes {}-{}/{}'.format(start, end, size)
+
+
+def if_range_matches(value, headers):
+    value = str(value).strip()
+    if value.startswith('W/'):
+        return False
+    if value.startswith('"'):
+        return value == headers.get_str('ETag')
+    return value == headers.get_str('Last-Modified')
+
+
+def file_etag(stat):
+    return '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size)
+
+
+class RangeStream:
+    def __init__(self, content, ranges, size, offset=0, content_type=None,
+                 executor=None):
+        self.content = content
+        self.ranges = ranges
+        self.size = size
+        self.offset = offset
+        self.executor = executor
+        if len(ranges) == 1:
+            self.content_type = content_type
+            self.parts = None
+            start, end = ranges[0]
+            self.content_length = end - start + 1
+            return
+        self.boundary = os.urandom(12).hex()
+        self.content_type = 'multipart/byteranges; boundary={}'.format(
+            self.boundary)
+        self.parts = []
+        for start, end in ranges:
+            lines = ['--{}'.format(self.boundary)]
+            if content_type:
+                lines.append('Content-Type: {}'.format(content_type))
+            lines.append('Content-Range: {}'.format(
+                content_range(start, end, size)))
+            lines.extend(['', ''])
+            self.parts.append('\r\n'.join(lines).encode('latin-1'))
+        self.trailer = '--{}--\r\n'.format(self.boundary).encode('latin-1')
+        self.content_length = len(self.trailer) + sum(
+            len(p) + end - start + 3
+            for p, (start, end) in zip(self.parts, ranges))
+
+    async def __aenter__(self):
+        if isinstance(self.content, pathlib.Path):
+            self.stream = await run(self.executor, self.content.open, 'rb')
+        else:
+            self.stream = self.content
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await run(self.executor, self.stream.close)
+
+    async def __aiter__(self):
+        for i, (start, end) in enumerate(self.ranges):
+            if self.parts:
+                yield self.parts[i]
+            await run(self.executor, self.stream.seek, self.offset + start)
+            remaining = end - start + 1
+            while remaining > 0:
+                b = await run(self.executor, self.stream.read,
+                              min(ContentStream.chunk_size, remaining))
+                if not b:
+                    break
+                remaining -= len(b)
+                yield b
+            if self.parts:
+                yield b'\r\n'
+        if self.parts:
+            yield self.trailer
+
+    async def sendfile(self, writer):
+        if not self.parts:
+            start, end = self.ranges[0]
+            return await sendfile(writer, self.stream, self.offset + start,
+                                  end - start + 1, executor=self.executor)
+        for part, (start, end) in zip(self.parts, self.ranges):
+            writer.write(part)
+            await sendfile(writer, self.stream, self.offset + start,
+                           end - start + 1, executor=self.executor)
+            writer.write(b'\r\n')
+        writer.write(self.trailer)
+        await writer.drain()
+
+
+def apply_ranges(stream, status, headers, request_headers):
+    content = getattr(stream, 'content', None)
+    if status != 200 or not (isinstance(content, pathlib.Path) or
+                             is_file(content)):
+        return stream, status
+    if 'Accept-Ranges' not in headers:
+        headers['Accept-Ranges'] = 'bytes'
+    if isinstance(content, pathlib.Path):
+        stat = getattr(stream, 'stat', None) or content.stat()
+        if 'ETag' not in headers:
+            headers['ETag'] = file_etag(stat)
+        if 'Last-Modified' not in headers:
+            headers['Last-Modified'] = http_date(stat.st_mtime)
+    if 'Range' not in request_headers or 'Content-Encoding' in headers:
+        return stream, status
+    if_range = request_headers.get_str('If-Range')
+    if if_range is not None and not if_range_matches(if_range, headers):
+        return stream, status
+    size = stream.content_length
+    ranges = parse_range(request_headers.get_str('Range'), size)
+    if ranges is None:
+        return stream, status
+    if not ranges:
+        headers['Content-Range'] = 'bytes */{}'.format(size)
+        headers['Content-Length'] = 0
+        if is_file(content):
+            content.close()
+        return ContentStream(None), 416
+    offset = 0 if isinstance(content, pathlib.Path) else content.tell()
+    stream = RangeStream(content, ranges, size, offset,
+                         headers.get_str('Content-Type'),
+                         getattr(stream, 'executor', None))
+    headers['Content-Type'] = stream.content_type
+    headers['Content-Length'] = stream.content_length
+    if len(ranges) == 1:
+        headers['Content-Range'] = content_range(ranges[0][0], ranges[0][1],
+                                                 size)
+    return stream, 206
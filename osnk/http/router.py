@@ -0,0 +1,126 @@
+import collections
+import functools
+import re
+
+
+class Router:
+    literal = re.compile(r'^\^([^.^$*+?{}\[\]\\|()]*)\$$')
+    prefix = re.compile(r'^\^([^.^$*+?{}\[\]\\|()]*)([*?{]?)')
+    unsafe = re.compile(r'\(\?P|\(\?\(|\(\?[aiLmsux-]+[:)]|\\[1-9]')
+
+    def __init__(self, cache_size=1024):
+        self.routes = []
+        self.options = collections.defaultdict(dict)
+        self.cache_size = cache_size
+        self._size = None
+
+    def add(self, method, pattern, fn, **options):
+        route = method.upper(), pattern, fn
+        self.routes.append(route)
+        self.options[route].update(options)
+
+    def _prefix(self, pattern):
+        if '|' in pattern.pattern:
+            return ''
+        m = self.prefix.match(pattern.pattern)
+        if not m:
+            return ''
+        prefix, quantifier = m.groups()
+        return prefix[:-1] if quantifier else prefix
+
+    def _combine(self, entries):
+        alternatives = []
+        groups = {}
+        index = 1
+        for i, pattern in entries:
+            alternatives.append('({})'.format(pattern.pattern))
+            groups[index] = i, pattern.groups
+            index += pattern.groups + 1
+        return re.compile('|'.join(alternatives)), groups
+
+    def _index(self, entries):
+        prefixes = {}
+        for i, pattern in entries:
+            prefixes.setdefault(self._prefix(pattern), []).append((i, pattern))
+        buckets = {}
+        for prefix in prefixes:
+            candidates = sorted(
+                x for p, xs in prefixes.items() if prefix.startswith(p)
+                for x in xs)
+            buckets[prefix] = self._combine(candidates)
+        lengths = sorted(set(len(p) for p in buckets), reverse=True)
+        return lengths, buckets
+
+    def compile(self):
+        default_flags = re.compile('').flags
+        literals = {}
+        combinable = {}
+        linear = {}
+        for i, (method, pattern, fn) in enumerate(self.routes):
+            m = self.literal.match(pattern.pattern)
+            if pattern.flags != default_flags:
+                target = linear
+            elif m:
+                literals.setdefault(method, {}).setdefault(m.group(1), i)
+                literals.setdefault(None, {}).setdefault(m.group(1), i)
+                continue
+            elif self.unsafe.search(pattern.pattern):
+                target = linear
+            else:
+                target = combinable
+            target.setdefault(method, []).append((i, pattern))
+            target.setdefault(None, []).append((i, pattern))
+        indexes = {}
+        try:
+            for method, entries in combinable.items():
+                indexes[method] = self._index(entries)
+        except (re.error, RecursionError, OverflowError):
+            indexes = {}
+            for method, entries in combinable.items():
+                linear[method] = sorted(linear.get(method, []) + entries,
+                                        key=lambda x: x[0])
+        self._literals = literals
+        self._indexes = indexes
+        self._linear = linear
+        self._size = len(self.routes)
+        if self.cache_size:
+            self._lookup = functools.lru_cache(self.cache_size)(self._match)
+        else:
+            self._lookup = self._match
+
+    def _match(self, method, path):
+        best = None
+        parts = ()
+        i = self._literals.get(method, {}).get(path)
+        if i is not None:
+            best = i
+        index = self._indexes.get(method)
+        if index:
+            lengths, buckets = index
+            for length in lengths:
+                bucket = buckets.get(path[:length])
+                if bucket:
+                    pattern, groups = bucket
+                    m = pattern.match(path)
+                    if m:
+                        i, n = groups[m.lastindex]
+                        if best is None or i < best:
+                            best = i
+                            parts = m.groups()[m.lastindex:m.lastindex + n]
+                    break
+        for i, pattern in self._linear.get(method, ()):
+            if best is not None and i > best:
+                break
+            m = pattern.match(path)
+            if m:
+                best = i
+                parts = m.groups()
+                break
+        if best is not None:
+            return self.routes[best], parts, True
+        return None, (), method is not None and self._match(None, path)[2]
+
+    def resolve(self, method, path):
+        if self._size != len(self.routes):
+            self.compile()
+        return self._lookup(method, path)
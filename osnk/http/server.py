@@ -1,31 +1,130 @@
 import asyncio
-import datetime
+import concurrent.futures
+import functools
 import json
+import os
 import pathlib
 import re
+import signal
+import socket
 import sys
+import time
 import traceback
-from .utils import ContentStream, Headers, Request
+from .cache import ResponseCache
+from .codec import get_codec, is_large
+from .client import default_pool
+from .compression import Compression
+from .files import AsyncFile, DirectoryIndex, run
+from .metrics import AccessLog, Exchange, Metrics
+from .multipart import MultipartParser
+from .ranges import apply_ranges
+from .router import Router
+from .utils import (BadRequest, Body, ContentStream, Headers, PayloadTooLarge,
+                    Request, RequestTimeout, body_framing, http_date, is_file,
+                    parse_head, unpack_response)
 
 pyversion = '.'.join(str(x) for x in sys.version_info[:3])
 default_name = 'Python/' + pyversion
 
 
-class HTTPServer:
-    first_line = re.compile(r'([^ ]+) ([^ ]+) [^ ]+')
+class Listener:
+    def __init__(self, loop, sock, factory, slots):
+        self.loop = loop
+        self.sockets = [sock]
+        self.factory = factory
+        self.slots = slots
+        self.task = loop.create_task(self._serve(sock))
+
+    async def _serve(self, sock):
+        while True:
+            await self.slots.acquire()
+            try:
+                conn, address = await self.loop.sock_accept(sock)
+            except OSError:
+                self.slots.release()
+                await asyncio.sleep(0.1)
+                continue
+            except BaseException:
+                self.slots.release()
+                raise
+            try:
+                conn.setblocking(False)
+                await self.loop.connect_accepted_socket(self.factory, conn)
+            except OSError:
+                conn.close()
+                self.slots.release()
+
+    def close(self):
+        self.task.cancel()
+        for sock in self.sockets:
+            sock.close()
+
+    async def wait_closed(self):
+        await asyncio.wait([self.task])
 
+
+class HTTPServer:
     def __init__(self, *, name=default_name, host='0.0.0.0', port=80,
-                 newline=b'\r\n', charset='utf-8', headers=None, debug=False):
+                 newline=b'\r\n', charset='utf-8', headers=None, debug=False,
+                 keep_alive_timeout=5, max_requests=100,
+                 route_cache_size=1024, max_body_size=None,
+                 response_cache=None, compression=None, executor=None,
+                 max_connections=None, max_inflight=None, retry_after=1,
+                 head_timeout=10, body_timeout=None, handler_timeout=None,
+                 write_timeout=None, metrics=None, access_log=None,
+                 codec=None, json_threshold=1000):
         self.name = name
         self.host = host
         self.port = port
         self.newline = newline
         self.charset = charset
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests = max_requests
+        self.max_body_size = max_body_size
+        self.max_connections = max_connections
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self.head_timeout = head_timeout
+        self.body_timeout = body_timeout
+        self.handler_timeout = handler_timeout
+        self.write_timeout = write_timeout
         self.headers = Headers({'Server': self.name})
         for k, v in Headers(headers):
             self.headers[k] = v
-        self.handlers = []
+        self.router = Router(cache_size=route_cache_size)
+        self.response_cache = response_cache or ResponseCache()
+        if compression is True:
+            compression = Compression()
+        self.compression = compression
+        if isinstance(executor, int):
+            executor = concurrent.futures.ThreadPoolExecutor(
+                executor, thread_name_prefix='osnk-io')
+        self.executor = executor
+        self.codec = get_codec(codec)
+        self.json_threshold = json_threshold
+        self.handlers = self.router.routes
         self.debug = debug
+        if metrics is True:
+            metrics = Metrics()
+        if metrics:
+            metrics.gauge('connections_active', lambda: len(self.connections))
+            metrics.gauge('requests_inflight', lambda: self.inflight)
+            metrics.track_pool(default_pool)
+        self.metrics = metrics
+        if access_log is True or access_log is None and debug:
+            access_log = AccessLog()
+        self.access_log = access_log
+        self.connections = set()
+        self.responding = set()
+        self.inflight = 0
+        self._slots = None
+        self._encoded = None, None, None
+
+    async def run_in_executor(self, fn, *args, **kwargs):
+        if kwargs:
+            fn = functools.partial(fn, *args, **kwargs)
+            args = ()
+        return await run(self.executor, fn, *args)
 
     async def _not_found(self):
         content = json.dumps('404 Not Found').encode(self.charset)
@@ -43,6 +142,39 @@ class HTTPServer:
         self._method_not_allowed = fn
         return fn
 
+    async def _bad_request(self):
+        content = json.dumps('400 Bad Request').encode(self.charset)
+        return content, 400, {'Content-Type': 'application/json'}
+
+    def bad_request(self, fn):
+        self._bad_request = fn
+        return fn
+
+    async def _payload_too_large(self):
+        content = json.dumps('413 Payload Too Large').encode(self.charset)
+        return content, 413, {'Content-Type': 'application/json'}
+
+    def payload_too_large(self, fn):
+        self._payload_too_large = fn
+        return fn
+
+    async def _request_timeout(self):
+        content = json.dumps('408 Request Timeout').encode(self.charset)
+        return content, 408, {'Content-Type': 'application/json'}
+
+    def request_timeout(self, fn):
+        self._request_timeout = fn
+        return fn
+
+    async def _service_unavailable(self):
+        content = json.dumps('503 Service Unavailable').encode(self.charset)
+        return content, 503, {'Content-Type': 'application/json',
+                              'Retry-After': self.retry_after}
+
+    def service_unavailable(self, fn):
+        self._service_unavailable = fn
+        return fn
+
     async def _error(self):
         content = json.dumps('500 Internal Server Error').encode(self.charset)
         return content, 500, {'Content-Type': 'application/json'}
@@ -51,7 +183,7 @@ class HTTPServer:
         self._error = fn
         return fn
 
-    def route(self, regex, methods=['GET']):
+    def route(self, regex, methods=['GET'], stream=False, cache=None):
         if not regex.startswith('^'):
             regex = '^' + regex
         if not regex.endswith('$'):
@@ -59,133 +191,267 @@ class HTTPServer:
         pattern = re.compile(regex)
 
         def wrapper(fn):
+            if isinstance(cache, ResponseCache):
+                fn = cache()(fn)
+            elif cache is True:
+                fn = self.response_cache()(fn)
+            elif cache:
+                fn = self.response_cache(cache)(fn)
             for method in methods:
-                self.handlers.append((method.upper(), pattern, fn))
+                self.router.add(method, pattern, fn, stream=stream)
 
         return wrapper
 
-    async def write_response(self, writer, method, path, query, resp):
-        max_returns = 3
-        min_returns = 1
-        if not isinstance(resp, tuple):
-            resp = resp,
-        resp = resp[:max_returns]
-        returns = len(resp)
-        if returns < min_returns:
-            m = 'not enough values to unpack (expected {}, got {})'
-            raise ValueError(m.format(min_returns, returns))
-        for _ in range(max_returns - returns):
-            resp += None,
-        content, status, headers = resp
-        if not status:
-            status = 200
+    def _encoded_headers(self):
+        key = id(self.headers), self.headers._version
+        if self._encoded[0] != key:
+            defaults = set()
+            block = []
+            for name, value in self.headers:
+                defaults.add(name.lower())
+                block.append('{}: {}'.format(name, value).encode(self.charset))
+                block.append(self.newline)
+            self._encoded = key, defaults, b''.join(block)
+        return self._encoded[1:]
+
+    async def write_response(self, writer, method, path, query, resp,
+                             keep_alive=False, version='HTTP/1.1',
+                             request=None, exchange=None):
+        content, status, headers = unpack_response(resp)
         headers = Headers(headers)
-        for k, v in self.headers:
-            headers[k] = v
-        if 'Date' not in headers:
-            d = datetime.datetime.utcnow()
-            headers['Date'] = d.strftime('%a, %d, %b %Y %H:%M:%S GMT')
+        bodyless = status in (204, 304) or 100 <= status < 200
+        defaults, encoded = self._encoded_headers()
+        if 'date' not in defaults and 'Date' not in headers:
+            headers['Date'] = http_date()
+        if isinstance(content, (dict, list)) and \
+                is_large(content, self.json_threshold):
+            content = await self.run_in_executor(self.codec.dumps, content)
+            if 'content-type' not in defaults and \
+                    'Content-Type' not in headers:
+                headers['Content-Type'] = 'application/json'
+        stat = None
+        if isinstance(content, pathlib.Path):
+            stat = await self.run_in_executor(content.stat)
+        elif is_file(content):
+            stat = await self.run_in_executor(os.fstat, content.fileno())
         try:
-            stream = ContentStream(content, self.charset)
-            if 'Content-Type' not in headers and stream.content_type:
+            stream = ContentStream(content, self.charset, self.executor,
+                                   self.codec, stat)
+            if 'content-type' not in defaults and \
+                    'Content-Type' not in headers and stream.content_type:
                 headers['Content-Type'] = stream.content_type
-            headers['Content-Length'] = stream.content_length
+            if stream.content_length is not None and not bodyless:
+                headers['Content-Length'] = stream.content_length
         except ValueError:
-            if 'Content-Type' not in headers:
+            if 'content-type' not in defaults and \
+                    'Content-Type' not in headers:
                 try:
                     headers['Content-Type'] = content.content_type
                 except AttributeError:
                     raise ValueError('content-type is required')
+            length = getattr(content, 'content_length', None)
+            if length is not None and not bodyless and \
+                    'Content-Length' not in headers:
+                headers['Content-Length'] = length
             stream = content
-        if self.debug:
-            print('[{}] "{} {}" {}'.format(
-                datetime.datetime.now(), method,
-                path + '?' + query if query else path, status))
-        writer.write('HTTP/1.1 {}'.format(status).encode(self.charset))
-        writer.write(self.newline)
+        if request is not None and not bodyless:
+            stream, status = apply_ranges(stream, status, headers,
+                                          request.headers)
+        if self.compression and request is not None and not bodyless and \
+                status != 206:
+            stream = await self.compression.apply(stream, headers,
+                                                  request.headers)
+        chunked = not bodyless and 'Content-Length' not in headers and \
+            version.upper() != 'HTTP/1.0' and hasattr(stream, '__aiter__')
+        if chunked:
+            headers['Transfer-Encoding'] = 'chunked'
+        elif not bodyless and 'Content-Length' not in headers:
+            keep_alive = False
+        if 'connection' in defaults:
+            connection = self.headers['Connection']
+        else:
+            connection = headers['Connection']
+        if connection is not None:
+            keep_alive = keep_alive and str(connection).lower() != 'close'
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        newline = self.newline.decode(self.charset)
+        lines = ['HTTP/1.1 {}'.format(status)]
         for name, value in headers:
-            writer.write(name.encode(self.charset))
-            writer.write(': '.encode(self.charset))
-            writer.write(str(value).encode(self.charset))
-            writer.write(self.newline)
-        writer.write(self.newline)
-        await writer.drain()
+            if name.lower() not in defaults:
+                lines.append('{}: {}'.format(name, value))
+        lines.append('')
+        head = newline.join(lines).encode(self.charset) + encoded + \
+            self.newline
+        if exchange is not None:
+            exchange.status = status
+            exchange.bytes_out = len(head)
+        self.responding.add(writer)
+        if bodyless or method == 'HEAD':
+            writer.write(head)
+            await writer.drain()
+            return keep_alive
+        if isinstance(stream, ContentStream) and \
+                isinstance(stream.content, (bytes, bytearray)):
+            writer.writelines([head, stream.content])
+            await writer.drain()
+            if exchange is not None:
+                exchange.bytes_out += len(stream.content)
+            return keep_alive
+        writer.write(head)
+        sent = 0
         async with stream as s:
-            async for b in s:
-                writer.write(b)
+            if chunked:
+                async for b in s:
+                    if b:
+                        writer.writelines([b'%x\r\n' % len(b), b, b'\r\n'])
+                        sent += len(b)
+                        await writer.drain()
+                writer.write(b'0\r\n\r\n')
                 await writer.drain()
+            elif hasattr(s, 'sendfile'):
+                await s.sendfile(writer)
+                sent = headers.get_int('Content-Length', 0)
+            else:
+                async for b in s:
+                    writer.write(b)
+                    sent += len(b)
+                    await writer.drain()
+        if exchange is not None:
+            exchange.bytes_out += sent
+        return keep_alive
 
-    async def handle(self, reader, writer, method, path, query):
+    def keep_alive(self, version, headers):
+        if 'Connection' in headers:
+            connection = headers['Connection']
+            if not isinstance(connection, tuple):
+                connection = connection,
+            tokens = [t.strip().lower() for c in connection
+                      for t in str(c).split(',')]
+            if 'close' in tokens:
+                return False
+            if 'keep-alive' in tokens:
+                return True
+        return version.upper() != 'HTTP/1.0'
+
+    async def handle(self, reader, writer, method, path, query,
+                     version='HTTP/1.1', keep_alive=False, headers=None,
+                     exchange=None):
         handler = None
-        raw_headers = []
-        async for line in reader:
-            line = line.strip()
-            if not line:
-                break
-            header = line.decode().split(':', 1)
-            if len(header) == 2:
-                name, value = header
-                name = name.strip()
-                value = value.strip()
-                try:
-                    value = int(value)
-                except ValueError:
-                    try:
-                        value = float(value)
-                    except ValueError:
-                        pass
-                raw_headers.append((name, value))
-        headers = Headers(raw_headers)
-        if 'Content-Length' in headers:
-            if isinstance(headers['Content-Length'], tuple):
-                content_length = headers['Content-Length'][0]
-            else:
-                content_length = headers['Content-Length']
-        else:
-            content_length = 0
-        content = bytearray()
-        if isinstance(content_length, int):
-            chunk = 1024
-            while len(content) < content_length:
-                content.extend(await reader.read(chunk))
+        if headers is None:
+            headers = Headers()
+        expect = headers.get_str('Expect', '').lower() == '100-continue'
+        keep_alive = keep_alive and self.keep_alive(version, headers)
+        try:
+            content_length, chunked = body_framing(headers)
+            body = Body(reader, content_length, chunked, self.max_body_size,
+                        writer if expect else None, self.body_timeout)
+        except BadRequest:
+            resp = await self._bad_request()
+            await self.write_response(writer, method, path, query, resp,
+                                      version=version, exchange=exchange)
+            return False
+        except PayloadTooLarge:
+            resp = await self._payload_too_large()
+            await self.write_response(writer, method, path, query, resp,
+                                      version=version, exchange=exchange)
+            return False
         if 'Host' in headers:
-            if isinstance(headers['Host'], tuple):
-                h = headers['Host'][0]
-            else:
-                h = headers['Host']
-            if ':' in h:
-                host = h.split(':')[0]
-            else:
-                host = h
+            host = headers.get_str('Host').split(':')[0]
         else:
             host = self.host
         url = 'http', host, self.port, path, query
-        request = Request(writer.transport, method, url, headers, content)
-        resources = []
-        for x, y, z in self.handlers:
-            m = y.match(path)
-            if m:
-                resources.append((x, y, z, m.groups()))
-        for x, y, z, parts in resources:
-            if x == method:
-                handler = z(request, *parts)
-                break
-        if resources and not handler:
-            handler = self._method_not_allowed()
-        if handler:
-            resp = await handler
-            if resp is None:
+        request = Request(writer.transport, method, url, headers, None, body,
+                          self.codec)
+        route, parts, found = self.router.resolve(method, path)
+        if exchange is not None and route:
+            exchange.route = route[1].pattern
+        try:
+            if route:
+                if not self.router.options.get(route, {}).get('stream'):
+                    await request.read()
+                handler = route[2](request, *parts)
+            elif found:
+                handler = self._method_not_allowed()
+            if handler:
+                try:
+                    resp = await self._wait(handler, self.handler_timeout)
+                except asyncio.TimeoutError:
+                    if self.handler_timeout is None:
+                        raise
+                    resp = await self._service_unavailable()
+                if resp is None:
+                    resp = await self._not_found()
+            else:
                 resp = await self._not_found()
-        else:
-            resp = await self._not_found()
-        await self.write_response(writer, method, path, query, resp)
+        except BadRequest:
+            resp = await self._bad_request()
+            keep_alive = False
+        except PayloadTooLarge:
+            resp = await self._payload_too_large()
+        except RequestTimeout:
+            resp = await self._request_timeout()
+        keep_alive = keep_alive and body.at_eof
+        if exchange is not None:
+            exchange.handled = time.perf_counter()
+            exchange.bytes_in += body.received
+        try:
+            return await self._wait(
+                self.write_response(writer, method, path, query, resp,
+                                    keep_alive=keep_alive, version=version,
+                                    request=request, exchange=exchange),
+                self.write_timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    def _deadline(self, writer, timeout):
+        if timeout is None:
+            return None
+        return self.loop.call_later(timeout, writer.transport.abort)
+
+    async def _wait(self, aw, timeout):
+        if timeout is None:
+            return await aw
+        return await asyncio.wait_for(aw, timeout)
 
     async def callback(self, reader, writer):
+        requests = 0
+        self.connections.add(writer)
         try:
-            first = await reader.readline()
-            m = self.first_line.search(first.decode())
-            if m:
-                method, uri = m.groups()
+            while True:
+                first = b''
+                timer = None
+                try:
+                    if requests:
+                        timer = self._deadline(writer, self.keep_alive_timeout)
+                        first = await reader.readexactly(1)
+                        if timer:
+                            timer.cancel()
+                    timer = self._deadline(writer, self.head_timeout)
+                    head = first + await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                finally:
+                    if timer:
+                        timer.cancel()
+                head = head.lstrip(b'\r\n')
+                if not head:
+                    continue
+                started = time.perf_counter()
+                try:
+                    start, headers = parse_head(head[:-4], self.charset)
+                except BadRequest:
+                    r = await self._bad_request()
+                    try:
+                        await self._wait(
+                            self.write_response(writer, 'GET', None, None, r),
+                            self.write_timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    break
+                if len(start) != 3:
+                    break
+                method, uri, version = start
                 method = method.upper()
                 parts = uri.split('?', 1)
                 if len(parts) == 1:
@@ -193,34 +459,214 @@ class HTTPServer:
                     query = None
                 else:
                     path, query = parts
+                exchange = None
+                if self.metrics or self.access_log:
+                    exchange = Exchange(method, path, query, started,
+                                        len(head))
+                    exchange.parsed = time.perf_counter()
+                requests += 1
+                if self.max_inflight and self.inflight >= self.max_inflight:
+                    r = await self._service_unavailable()
+                    try:
+                        await self._wait(
+                            self.write_response(writer, method, path, query,
+                                                r, version=version,
+                                                exchange=exchange),
+                            self.write_timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._record(exchange)
+                    break
+                keep_alive = not self.max_requests or \
+                    requests < self.max_requests
+                self.inflight += 1
+                self.responding.discard(writer)
                 try:
-                    await self.handle(reader, writer, method, path, query)
+                    keep_alive = await self.handle(reader, writer, method,
+                                                   path, query, version,
+                                                   keep_alive, headers,
+                                                   exchange)
+                except asyncio.IncompleteReadError:
+                    break
                 except ConnectionError:
                     raise
                 except Exception:
+                    if writer in self.responding:
+                        writer.transport.abort()
+                        raise
                     r = await self._error()
-                    await self.write_response(writer, method, path, query, r)
+                    await self.write_response(writer, method, path, query, r,
+                                              exchange=exchange)
                     raise
+                finally:
+                    self.inflight -= 1
+                    self._record(exchange)
+                if not keep_alive:
+                    break
         except Exception:
             print(traceback.format_exc(), file=sys.stderr)
         finally:
+            self.connections.discard(writer)
+            self.responding.discard(writer)
             writer.close()
+            if self._slots is not None:
+                self._slots.release()
+
+    def _record(self, exchange):
+        if exchange is None:
+            return
+        exchange.finished = time.perf_counter()
+        if self.metrics:
+            self.metrics.observe(exchange)
+        if self.access_log:
+            self.access_log.log(exchange)
 
-    def start(self, loop=None):
+    def expose_metrics(self, path='/metrics'):
+        if not self.metrics:
+            raise ValueError('metrics are not enabled')
+
+        @self.route(re.escape(path))
+        async def metrics(request):
+            content = self.metrics.render().encode(self.charset)
+            content_type = 'text/plain; version=0.0.4; charset={}'
+            return content, 200, {
+                'Content-Type': content_type.format(self.charset)}
+
+    def start(self, loop=None, sock=None):
         if not loop:
             loop = asyncio.get_event_loop()
         self.loop = loop
-        return asyncio.start_server(self.callback, self.host, self.port,
-                                    loop=self.loop)
+        if self.max_connections:
+            return self._listen(loop, sock or self.bind())
+        address = {'sock': sock} if sock else \
+            {'host': self.host, 'port': self.port}
+        if sys.version_info < (3, 10):
+            address['loop'] = loop
+        return asyncio.start_server(self.callback, **address)
+
+    async def _listen(self, loop, sock):
+        def factory():
+            reader = asyncio.StreamReader()
+            return asyncio.StreamReaderProtocol(reader, self.callback)
+        self._slots = asyncio.Semaphore(self.max_connections)
+        return Listener(loop, sock, factory, self._slots)
+
+    def bind(self, reuse_port=False, backlog=100):
+        family, type, proto, _, address = socket.getaddrinfo(
+            self.host, self.port, type=socket.SOCK_STREAM,
+            flags=socket.AI_PASSIVE)[0]
+        sock = socket.socket(family, type, proto)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        sock.listen(backlog)
+        sock.setblocking(False)
+        return sock
+
+    async def shutdown(self, server, timeout=10):
+        server.close()
+        await server.wait_closed()
+        deadline = self.loop.time() + timeout
+        while self.inflight and self.loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        for writer in list(self.connections):
+            writer.close()
+        if self.access_log:
+            await self.access_log.close()
+
+    def serve(self, sock=None, shutdown_timeout=10):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(self.start(loop, sock))
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, loop.stop)
+            except (NotImplementedError, RuntimeError, AttributeError):
+                pass
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.shutdown(server, shutdown_timeout))
+            loop.close()
+
+    def run(self, workers=1, reuse_port=False, shutdown_timeout=10):
+        if workers <= 1:
+            return self.serve(shutdown_timeout=shutdown_timeout)
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('workers require os.fork()')
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError('SO_REUSEPORT is not supported')
+        sock = None if reuse_port else self.bind()
+        children = {}
+        stopping = []
+
+        def spawn():
+            pid = os.fork()
+            if pid:
+                children[pid] = time.monotonic()
+                return
+            status = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self.serve(sock or self.bind(reuse_port=True),
+                           shutdown_timeout)
+            except BaseException:
+                print(traceback.format_exc(), file=sys.stderr)
+                status = 1
+            finally:
+                os._exit(status)
+
+        def stop(signum, frame):
+            stopping.append(signum)
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        handlers = {signum: signal.signal(signum, stop)
+                    for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for _ in range(workers):
+                spawn()
+            while children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                started = children.pop(pid, None)
+                if started is None or stopping:
+                    continue
+                if time.monotonic() - started < 1:
+                    time.sleep(1)
+                if not stopping:
+                    spawn()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            if sock:
+                sock.close()
 
 
 if __name__ == '__main__':
-    port = sys.argv[1] if len(sys.argv) > 1 else 8000
-    token = sys.argv[2] if len(sys.argv) > 2 else None
-    server = HTTPServer(port=port, debug=True,
-                        headers={'Access-Control-Allow-Origin': '*'})
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', nargs='?', type=int, default=8000)
+    parser.add_argument('token', nargs='?')
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('--reuse-port', action='store_true')
+    parser.add_argument('--io-threads', type=int)
+    args = parser.parse_args()
+    token = args.token
+    server = HTTPServer(port=args.port, debug=True,
+                        headers={'Access-Control-Allow-Origin': '*'},
+                        executor=args.io_threads)
 
-    import functools
+    index = DirectoryIndex(pathlib.Path.cwd(), executor=server.executor)
 
     def requires(token):
         def decorator(fn):
@@ -250,41 +696,50 @@ if __name__ == '__main__':
     @requires(token)
     async def get(request, path):
         p = pathlib.Path.cwd() / path.replace('..', '')
-        if p.is_dir():
-            r = []
-            for x in p.iterdir():
-                if x.is_dir():
-                    size = sum(y.stat().st_size for y in x.glob('**/*')
-                               if y.is_file())
-                    r.append((x.name, size))
-                else:
-                    r.append((x.name, x.stat().st_size))
-            return sorted(r)
-        elif p.is_file():
+        if await server.run_in_executor(p.is_dir):
+            return await index.listing(p)
+        elif await server.run_in_executor(p.is_file):
             return p
 
-    @server.route('/(.*)', methods=['POST'])
+    @server.route('/(.*)', methods=['POST'], stream=True)
     @requires(token)
     async def post(request, path):
         p = pathlib.Path.cwd() / path.replace('..', '')
-        p.parent.mkdir(parents=True, exist_ok=True)
-        with p.open('ab') as f:
-            f.write(request.content)
+        content_type = request.headers.get_str('Content-Type', '')
+        if content_type.lower().startswith('multipart/form-data'):
+            await server.run_in_executor(p.mkdir, parents=True, exist_ok=True)
+            parser = MultipartParser.from_request(request,
+                                                  executor=server.executor)
+            async for part in parser:
+                name = pathlib.Path(part.filename or '').name
+                if name and name not in ('.', '..'):
+                    await part.save(p / name, executor=server.executor)
+                    index.invalidate(p / name)
+                part.close()
+            return None, 200
+        await server.run_in_executor(p.parent.mkdir, parents=True,
+                                     exist_ok=True)
+        async with await AsyncFile.open(p, 'ab', server.executor) as f:
+            async for chunk in request.stream():
+                await f.write(chunk)
+        index.invalidate(p)
         return None, 200
 
     @server.route('/(.*)', methods=['DELETE'])
     @requires(token)
     async def delete(request, path):
         p = pathlib.Path.cwd() / path.replace('..', '')
-        if p.is_file():
+        if await server.run_in_executor(p.is_file):
             try:
-                p.unlink()
+                await server.run_in_executor(p.unlink)
+                index.invalidate(p)
                 return None, 200
             except FileNotFoundError:
                 pass
-        elif p.is_dir():
+        elif await server.run_in_executor(p.is_dir):
             try:
-                p.rmdir()
+                await server.run_in_executor(p.rmdir)
+                index.invalidate(p)
                 return None, 200
             except OSError:
                 return None, 403
@@ -294,16 +749,6 @@ if __name__ == '__main__':
         return None, 200, {'Allow': 'GET, POST, DELETE, OPTIONS',
                            'Access-Control-Allow-Headers': 'Authorization'}
 
-    loop = asyncio.get_event_loop()
-    results = loop.run_until_complete(server.start(loop))
     start = 'Serving HTTP on {host} port {port} (http://{host}:{port}) ...'
     print(start.format(host=server.host, port=server.port))
-
-    try:
-        loop.run_forever()
-    except KeyboardInterrupt:
-        pass
-    finally:
-        results.close()
-        loop.run_until_complete(results.wait_closed())
-        loop.close()
+    server.run(workers=args.workers, reuse_port=args.reuse_port)
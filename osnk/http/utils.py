@@ -1,18 +1,83 @@
-import json
+import asyncio
+import email.utils
 import io
+import os
 import pathlib
+import time
 import urllib.request
+from .codec import default_codec
+from .files import AsyncFile, run
+
+SendfileNotAvailableError = getattr(asyncio, 'SendfileNotAvailableError',
+                                    RuntimeError)
+
+
+async def sendfile(writer, file, offset=0, count=None, chunk_size=262144,
+                   executor=None):
+    transport = writer.transport
+    loop = asyncio.get_event_loop()
+    if hasattr(loop, 'sendfile') and \
+            transport.get_extra_info('sslcontext') is None:
+        try:
+            return await loop.sendfile(transport, file, offset, count,
+                                       fallback=False)
+        except (SendfileNotAvailableError, NotImplementedError):
+            pass
+    await run(executor, file.seek, offset)
+    sent = 0
+    while count is None or sent < count:
+        size = chunk_size if count is None else min(chunk_size, count - sent)
+        b = await run(executor, file.read, size)
+        if not b:
+            break
+        writer.write(b)
+        sent += len(b)
+        await writer.drain()
+    return sent
+
+
+def http_date(timestamp=None, _cache=[None, None]):
+    if timestamp is not None:
+        return email.utils.formatdate(int(timestamp), usegmt=True)
+    second = int(time.time())
+    if _cache[0] != second:
+        _cache[1] = email.utils.formatdate(second, usegmt=True)
+        _cache[0] = second
+    return _cache[1]
+
+
+def unpack_response(resp):
+    max_returns = 3
+    min_returns = 1
+    if not isinstance(resp, tuple):
+        resp = resp,
+    returns = len(resp)
+    if returns < min_returns:
+        m = 'not enough values to unpack (expected {}, got {})'
+        raise ValueError(m.format(min_returns, returns))
+    if returns != max_returns:
+        resp = resp[:max_returns] + (None,) * (max_returns - returns)
+    content, status, headers = resp
+    return content, status or 200, headers
+
+
+def is_file(content):
+    return isinstance(content, (io.BufferedIOBase, io.RawIOBase)) and \
+        hasattr(content, 'fileno')
 
 
 class ContentStream:
-    def __init__(self, content, charset='utf-8'):
+    chunk_size = 262144
+
+    def __init__(self, content, charset='utf-8', executor=None, codec=None,
+                 stat=None):
         if isinstance(content, str):
             self.content_type = 'text/plain'
             self.content = content.encode(charset)
             self.content_length = len(self.content)
         elif isinstance(content, (dict, list)):
             self.content_type = 'application/json'
-            self.content = json.dumps(content).encode(charset)
+            self.content = (codec or default_codec).dumps(content)
             self.content_length = len(self.content)
         elif isinstance(content, (bytearray, bytes)):
             self.content_type = 'application/octet-stream'
@@ -21,41 +86,266 @@ class ContentStream:
         elif isinstance(content, pathlib.Path):
             self.content_type = 'application/octet-stream'
             self.content = content
-            self.content_length = content.stat().st_size
+            stat = stat or content.stat()
+            self.content_length = stat.st_size
+        elif is_file(content):
+            self.content_type = 'application/octet-stream'
+            self.content = content
+            stat = stat or os.fstat(content.fileno())
+            self.content_length = stat.st_size - content.tell()
         elif content is None:
             self.content_type = None
             self.content = None
             self.content_length = 0
+        elif hasattr(content, '__aiter__') or hasattr(content, '__next__'):
+            self.content_type = getattr(content, 'content_type',
+                                        'application/octet-stream')
+            self.content = content
+            self.content_length = getattr(content, 'content_length', None)
         else:
             m = "invalid type '{}'"
             raise ValueError(m.format(type(content).__name__))
+        self.charset = charset
+        self.executor = executor
+        self.stat = stat
 
     async def __aenter__(self):
+        self.iterator = None
         if isinstance(self.content, (bytearray, bytes)) or \
                 self.content is None:
             self.stream = io.BytesIO(self.content)
         elif isinstance(self.content, pathlib.Path):
-            self.stream = self.content.open('rb')
+            self.stream = await run(self.executor, self.content.open, 'rb')
+            self.iterator = AsyncFile(self.stream, self.executor,
+                                      self.chunk_size)
+        elif is_file(self.content):
+            self.stream = self.content
+            self.iterator = AsyncFile(self.stream, self.executor,
+                                      self.chunk_size)
         else:
-            m = "invalid type '{}'"
-            raise ValueError(m.format(type(self.content).__name__))
+            if hasattr(self.content, '__aenter__'):
+                self.stream = await self.content.__aenter__()
+            else:
+                self.stream = self.content
+            if hasattr(self.stream, '__aiter__'):
+                self.iterator = self.stream.__aiter__()
+            else:
+                self.iterator = self.stream
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        self.stream.close()
+        if isinstance(self.iterator, AsyncFile):
+            await self.iterator.close()
+        elif hasattr(self.content, '__aexit__'):
+            await self.content.__aexit__(exc_type, exc, tb)
+        elif hasattr(self.stream, 'aclose'):
+            await self.stream.aclose()
+        elif hasattr(self.stream, 'close'):
+            self.stream.close()
 
     def __aiter__(self):
         return self
 
     async def __anext__(self):
-        r = self.stream.read(1024)
+        if self.iterator is None:
+            r = self.stream.read(self.chunk_size)
+        elif hasattr(self.iterator, '__anext__'):
+            r = await self.iterator.__anext__()
+        else:
+            try:
+                r = next(self.iterator)
+            except StopIteration:
+                raise StopAsyncIteration
+        if isinstance(r, str):
+            r = r.encode(self.charset)
+        elif self.iterator is None and not r:
+            raise StopAsyncIteration
+        return r
+
+    async def sendfile(self, writer):
+        if isinstance(self.iterator, AsyncFile):
+            await sendfile(writer, self.stream, self.stream.tell(),
+                           self.content_length, executor=self.executor)
+        elif hasattr(self.stream, 'sendfile'):
+            await self.stream.sendfile(writer)
+        elif self.iterator is not None:
+            async for b in self:
+                writer.write(b)
+                await writer.drain()
+        else:
+            writer.write(self.stream.read())
+            await writer.drain()
+
+
+class BadRequest(Exception):
+    pass
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class RequestTimeout(Exception):
+    pass
+
+
+def body_framing(headers):
+    lengths = set(v.strip() for value in headers.get_all('Content-Length')
+                  for v in value.split(','))
+    codings = [c.strip().lower()
+               for value in headers.get_all('Transfer-Encoding')
+               for c in value.split(',')]
+    if codings:
+        if lengths or codings != ['chunked']:
+            m = "invalid Transfer-Encoding '{}'"
+            raise BadRequest(m.format(', '.join(codings)))
+        return 0, True
+    if not lengths:
+        return 0, False
+    length = lengths.pop()
+    if lengths or not length or length.strip('0123456789'):
+        raise BadRequest('invalid Content-Length')
+    return int(length), False
+
+
+class Body:
+    chunk_size = 65536
+
+    def __init__(self, reader, length=0, chunked=False, max_size=None,
+                 writer=None, timeout=None):
+        self.reader = reader
+        self.length = length
+        self.chunked = chunked
+        self.max_size = max_size
+        self.writer = writer
+        self.timeout = timeout
+        self.received = 0
+        self.at_eof = not chunked and length is not None and not length
+        self._remaining = 0 if chunked or length is None else length
+        if max_size is not None and not chunked and length is not None and \
+                length > max_size:
+            raise PayloadTooLarge(length)
+
+    @classmethod
+    def buffered(cls, content):
+        body = cls(None, len(content))
+        body._content = content
+        return body
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        r = await self.read_chunk()
         if not r:
             raise StopAsyncIteration
         return r
 
+    def _continue(self):
+        if self.writer:
+            self.writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            self.writer = None
+
+    async def _wait(self, aw):
+        if self.timeout is None:
+            return await aw
+        try:
+            return await asyncio.wait_for(aw, self.timeout)
+        except asyncio.TimeoutError:
+            raise RequestTimeout(self.received)
+
+    def _count(self, size):
+        self.received += size
+        if self.max_size is not None and self.received > self.max_size:
+            raise PayloadTooLarge(self.received)
+
+    async def _next_chunk(self):
+        line = await self._wait(self.reader.readline())
+        if not line.endswith(b'\n'):
+            raise asyncio.IncompleteReadError(line, None)
+        try:
+            size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise BadRequest(line)
+        if size < 0:
+            raise BadRequest(line)
+        if size:
+            self._remaining = size
+            return
+        while True:
+            line = await self._wait(self.reader.readline())
+            if not line.endswith(b'\n'):
+                raise asyncio.IncompleteReadError(line, None)
+            if not line.strip():
+                break
+        self.at_eof = True
+
+    async def read_chunk(self, size=None):
+        if self.at_eof:
+            return b''
+        if self.reader is None:
+            self.at_eof = True
+            return self._content
+        self._continue()
+        if self.length is None and not self.chunked:
+            r = await self._wait(self.reader.read(size or self.chunk_size))
+            if not r:
+                self.at_eof = True
+            self._count(len(r))
+            return r
+        if self.chunked and not self._remaining:
+            await self._next_chunk()
+            if self.at_eof:
+                return b''
+        n = min(size or self.chunk_size, self._remaining)
+        self._count(n)
+        r = await self._wait(self.reader.readexactly(n))
+        self._remaining -= n
+        if not self._remaining:
+            if self.chunked:
+                end = await self._wait(self.reader.readexactly(2))
+                if end != b'\r\n':
+                    raise BadRequest(end)
+            else:
+                self.at_eof = True
+        return r
+
+    async def read(self):
+        if not self.chunked and self.reader is not None and \
+                self.length is not None and self.timeout is None:
+            return await self.read_chunk(self._remaining)
+        chunks = []
+        async for chunk in self:
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+
+def coerce(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def parse_head(data, charset='utf-8'):
+    lines = data.split(b'\r\n')
+    start = lines[0].decode(charset).split(' ', 2)
+    return start, Headers.parse(lines[1:], charset)
+
 
 class Headers:
+    __slots__ = ('_keyvals', '_raw', '_typed', '_version', '_shared')
+
     def __init__(self, keyvals=None):
+        self._raw = None
+        self._typed = None
+        self._version = 0
+        self._shared = False
         if keyvals:
             if isinstance(keyvals, (dict, list, set, tuple)):
                 self._keyvals = {}
@@ -76,23 +366,98 @@ class Headers:
                         currentvals.extend(vals)
                     else:
                         self._keyvals[key] = (k, vals)
-            elif isinstance(keyvals, self.__class__):
-                self._keyvals = dict(keyvals._keyvals)
+            elif isinstance(keyvals, Headers):
+                keyvals._shared = True
+                self._keyvals = keyvals._keyvals
+                self._raw = keyvals._raw
+                self._typed = keyvals._typed
+                self._shared = True
             else:
                 raise ValueError()
         else:
             self._keyvals = {}
 
+    @classmethod
+    def parse(cls, lines, charset='utf-8'):
+        self = cls()
+        keyvals = self._keyvals
+        for line in lines:
+            name, sep, value = line.partition(b':')
+            if not sep:
+                continue
+            if name.split() != [name]:
+                raise BadRequest(line)
+            name = name.decode(charset)
+            value = value.strip().decode(charset)
+            key = name.lower()
+            if key in keyvals:
+                keyvals[key][1].append(value)
+            else:
+                keyvals[key] = (name, [value])
+        self._raw = set(keyvals)
+        return self
+
+    def _values(self, key):
+        k, vals = self._keyvals[key]
+        if self._raw and key in self._raw:
+            if self._typed is None:
+                self._typed = {}
+            typed = self._typed.get(key)
+            if typed is None:
+                typed = self._typed[key] = [coerce(x) for x in vals]
+            return typed
+        return vals
+
+    def _modify(self, key):
+        self._version += 1
+        if self._shared:
+            self._keyvals = dict(self._keyvals)
+            self._raw = set(self._raw) if self._raw else None
+            self._typed = dict(self._typed) if self._typed else None
+            self._shared = False
+        if self._raw:
+            self._raw.discard(key)
+        if self._typed:
+            self._typed.pop(key, None)
+
+    def get_str(self, key, default=None):
+        r = self._keyvals.get(key.lower())
+        if r and r[1]:
+            return str(r[1][0])
+        return default
+
+    def get_all(self, key):
+        r = self._keyvals.get(key.lower())
+        return [str(v) for v in r[1]] if r else []
+
+    def get_int(self, key, default=None):
+        r = self._keyvals.get(key.lower())
+        if r and r[1]:
+            try:
+                return int(r[1][0])
+            except (TypeError, ValueError):
+                pass
+        return default
+
     def __setitem__(self, key, value):
+        lower = key.lower()
+        self._modify(lower)
         if isinstance(value, (list, set, tuple)):
-            self._keyvals[key.lower()] = (key, value)
+            self._keyvals[lower] = (key, value)
         else:
-            self._keyvals[key.lower()] = (key, (value,))
+            self._keyvals[lower] = (key, (value,))
+
+    def __delitem__(self, key):
+        lower = key.lower()
+        if lower not in self._keyvals:
+            raise KeyError(key)
+        self._modify(lower)
+        del self._keyvals[lower]
 
     def __getitem__(self, key):
-        r = self._keyvals.get(key.lower())
-        if r:
-            key, vals = r
+        key = key.lower()
+        if key in self._keyvals:
+            vals = self._values(key)
             c = len(vals)
             if c == 1:
                 return vals[0]
@@ -106,6 +471,7 @@ class Headers:
     def __repr__(self):
         params = {}
         for key, (k, v) in self._keyvals.items():
+            v = self._values(key)
             if len(v) == 1:
                 params[k] = v[0]
             else:
@@ -114,7 +480,7 @@ class Headers:
 
     def _generator(self):
         for key, (k, v) in self._keyvals.items():
-            for x in v:
+            for x in self._values(key):
                 yield k, x
 
     def __iter__(self):
@@ -122,6 +488,8 @@ class Headers:
 
 
 class Arguments:
+    __slots__ = ('_keyvals',)
+
     def __init__(self, keyvals=None):
         if keyvals:
             if isinstance(keyvals, (dict, list, set, tuple)):
@@ -183,30 +551,45 @@ class Arguments:
 
 
 class Request:
-    def __init__(self, transport, method, url, headers, content):
+    __slots__ = ('transport', 'method', 'url', 'headers', 'content', 'body',
+                 'codec', '_args', '_form', '_json')
+
+    def __init__(self, transport, method, url, headers, content, body=None,
+                 codec=None):
         self.transport = transport
         self.method = method
         self.url = url
         if isinstance(url, (list, tuple)):
             length = len(url)
             maxlen = 5
-            if length >= maxlen:
-                self.url = url[:maxlen]
-            else:
-                self.url = url
-                for _ in range(maxlen - length):
-                    self.url += (None,)
+            if length != maxlen or not isinstance(url, tuple):
+                self.url = tuple(url[:maxlen]) + (None,) * (maxlen - length)
         if isinstance(headers, Headers):
             self.headers = headers
         else:
             self.headers = Headers(headers)
         self.content = content
+        if body is None and content is not None:
+            body = Body.buffered(content)
+        self.body = body
+        self.codec = codec or default_codec
+
+    async def read(self):
+        if self.content is None:
+            self.content = await self.body.read() if self.body else b''
+        return self.content
+
+    def stream(self):
+        if self.body is None or self.body.at_eof and self.content is not None:
+            return Body.buffered(self.content or b'')
+        return self.body
 
     @property
     def args(self):
         if not hasattr(self, '_args'):
             shceme, host, port, path, query = self.url
-            self._args = Arguments(urllib.parse.parse_qs(query))
+            self._args = Arguments(urllib.parse.parse_qs(query) if query
+                                   else None)
         return self._args
 
     @property
@@ -224,6 +607,15 @@ class Request:
             self._form = Arguments(urllib.parse.parse_qs(s))
         return self._form
 
+    @property
+    def json(self):
+        if not hasattr(self, '_json'):
+            if self.content is None:
+                raise ValueError('request body has not been read')
+            self._json = self.codec.loads(self.content) if self.content \
+                else None
+        return self._json
+
     def __repr__(self):
         return "{}('{}', {}, {}, {})".format(self.__class__.__name__,
                                              self.method, self.url,
@@ -231,9 +623,72 @@ class Request:
 
 
 class Response:
-    def __init__(self, reader, writer, status, headers, content):
+    __slots__ = ('reader', 'writer', 'status', 'headers', 'content',
+                 'from_cache', 'body', 'decoder', 'codec')
+    chunk_size = 65536
+    json_threshold = 1048576
+
+    def __init__(self, reader, writer, status, headers, content=None,
+                 from_cache=False, body=None, decoder=None, codec=None):
         self.reader = reader
         self.writer = writer
         self.status = status
         self.headers = headers
         self.content = content
+        self.from_cache = from_cache
+        self.body = body
+        self.decoder = decoder
+        self.codec = codec or default_codec
+
+    @property
+    def consumed(self):
+        return self.content is not None or self.body is None or \
+            self.body.at_eof and self.decoder is None
+
+    async def iter_chunks(self, size=None):
+        size = size or self.chunk_size
+        if self.content is not None:
+            for i in range(0, len(self.content), size):
+                yield self.content[i:i + size]
+            return
+        if self.body is None:
+            return
+        while not self.body.at_eof:
+            chunk = await self.body.read_chunk(size)
+            if self.decoder:
+                for piece in self.decoder.iter_decompress(chunk, size):
+                    yield piece
+            elif chunk:
+                yield chunk
+        decoder, self.decoder = self.decoder, None
+        if decoder:
+            chunk = decoder.flush()
+            if chunk:
+                yield chunk
+
+    async def read(self):
+        if self.content is None:
+            self.content = b''.join([c async for c in self.iter_chunks()])
+        return self.content
+
+    async def json(self):
+        data = await self.read()
+        if len(data) < self.json_threshold:
+            return self.codec.loads(data)
+        return await run(None, self.codec.loads, data)
+
+    async def save_to(self, path, mode='wb', buffer_size=1048576,
+                      executor=None):
+        written = 0
+        buffer = bytearray()
+        async with await AsyncFile.open(path, mode, executor) as f:
+            async for chunk in self.iter_chunks(buffer_size):
+                buffer += chunk
+                if len(buffer) >= buffer_size:
+                    await f.write(buffer)
+                    written += len(buffer)
+                    buffer = bytearray()
+            if buffer:
+                await f.write(buffer)
+                written += len(buffer)
+        return written
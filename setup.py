@@ -1,8 +1,8 @@
 import sys
 from setuptools import setup
 
-if sys.version_info < (3, 5, 2):
-    raise RuntimeError('Python < 3.5.2 is not supported')
+if sys.version_info < (3, 6):
+    raise RuntimeError('Python < 3.6 is not supported')
 
 setup(
     name='http',
@@ -13,10 +13,13 @@ setup(
     author_email='osnk@renjaku.jp',
     url='https://github.com/oshinko/pyhttp',
     packages=['osnk.http'],
+    extras_require={
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+    },
     classifiers=[
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: Implementation :: CPython'
@@ -0,0 +1,68 @@
+import asyncio
+from osnk.http import client
+
+
+all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        tasks = all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.gather(*tasks,
+                                                   return_exceptions=True))
+        loop.close()
+
+
+def reader(data):
+    r = asyncio.StreamReader()
+    r.feed_data(data)
+    r.feed_eof()
+    return r
+
+
+class Served:
+    def __init__(self, server):
+        self.server = server
+        self.url = None
+        self.pool = None
+        self._server = None
+
+    async def __aenter__(self):
+        sock = self.server.bind()
+        self.url = 'http://127.0.0.1:{}'.format(sock.getsockname()[1])
+        self.pool = client.ClientPool()
+        self._server = await self.server.start(sock=sock)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.pool.close()
+        await self.server.shutdown(self._server, 0)
+
+    def connect(self):
+        return asyncio.open_connection('127.0.0.1',
+                                       int(self.url.rsplit(':', 1)[1]))
+
+    async def raw(self, data, timeout=5):
+        reader, writer = await self.connect()
+        writer.write(data)
+        try:
+            return await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+
+    def request(self, path, **kwargs):
+        kwargs.setdefault('pool', self.pool)
+        return client.request(self.url + path, **kwargs)
+
+
+def send(server, data, timeout=5):
+    async def main():
+        async with Served(server) as served:
+            return await served.raw(data, timeout)
+    return run(main())
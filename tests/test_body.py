@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+from osnk.http.utils import (BadRequest, Body, Headers, PayloadTooLarge,
+                             body_framing, parse_head)
+from .support import reader, run
+
+
+def read(data, **kwargs):
+    async def main():
+        body = Body(reader(data), **kwargs)
+        return await body.read(), body
+    return run(main())
+
+
+class ChunkedBodyTest(unittest.TestCase):
+    def test_chunks(self):
+        data, body = read(b'5\r\nhello\r\n6;ext=1\r\n world\r\n0\r\n\r\n',
+                          chunked=True)
+        self.assertEqual(data, b'hello world')
+        self.assertTrue(body.at_eof)
+        self.assertEqual(body.received, 11)
+
+    def test_trailers(self):
+        data, body = read(b'3\r\nabc\r\n0\r\nX-Sum: 1\r\n\r\n', chunked=True)
+        self.assertEqual(data, b'abc')
+        self.assertTrue(body.at_eof)
+
+    def test_malformed_size(self):
+        for data in (b'zz\r\n', b'-5\r\nhello\r\n', b'\r\n'):
+            with self.assertRaises(BadRequest):
+                read(data, chunked=True)
+
+    def test_missing_chunk_terminator(self):
+        with self.assertRaises(BadRequest):
+            read(b'5\r\nhelloXX0\r\n\r\n', chunked=True)
+
+    def test_truncated(self):
+        with self.assertRaises(asyncio.IncompleteReadError):
+            read(b'5\r\nhel', chunked=True)
+        with self.assertRaises(asyncio.IncompleteReadError):
+            read(b'5\r\nhello\r\n', chunked=True)
+
+    def test_max_size(self):
+        with self.assertRaises(PayloadTooLarge):
+            read(b'5\r\nhello\r\n5\r\nworld\r\n0\r\n\r\n', chunked=True,
+                 max_size=8)
+
+
+class LengthBodyTest(unittest.TestCase):
+    def test_content_length(self):
+        data, body = read(b'hello world', length=5)
+        self.assertEqual(data, b'hello')
+        self.assertTrue(body.at_eof)
+
+    def test_close_delimited(self):
+        data, body = read(b'until close', length=None)
+        self.assertEqual(data, b'until close')
+
+    def test_declared_length_too_large(self):
+        with self.assertRaises(PayloadTooLarge):
+            Body(None, 10, max_size=5)
+
+
+class FramingTest(unittest.TestCase):
+    def framing(self, *lines):
+        return body_framing(parse_head(b'\r\n'.join(
+            (b'POST / HTTP/1.1',) + lines))[1])
+
+    def test_framing(self):
+        self.assertEqual(self.framing(), (0, False))
+        self.assertEqual(self.framing(b'Content-Length: 12'), (12, False))
+        self.assertEqual(self.framing(b'Content-Length: 5',
+                                      b'Content-Length: 5, 5'), (5, False))
+        self.assertEqual(self.framing(b'Transfer-Encoding: Chunked'),
+                         (0, True))
+        self.assertEqual(body_framing(Headers({'Content-Length': 3})),
+                         (3, False))
+
+    def test_invalid(self):
+        for lines in ([b'Content-Length: abc'], [b'Content-Length: -1'],
+                      [b'Content-Length: 1e3'], [b'Content-Length: \xd9\xa3'],
+                      [b'Content-Length: 1', b'Content-Length: 2'],
+                      [b'Transfer-Encoding: chunked', b'Content-Length: 2'],
+                      [b'Transfer-Encoding: gzip'],
+                      [b'Transfer-Encoding: chunked, chunked']):
+            with self.subTest(lines=lines):
+                with self.assertRaises(BadRequest):
+                    self.framing(*lines)
+
+    def test_whitespace_in_field_name(self):
+        for line in (b'Host : x', b'Host\t: x', b' Host: x', b': x',
+                     b'X Y: z'):
+            with self.subTest(line=line):
+                with self.assertRaises(BadRequest):
+                    parse_head(b'GET / HTTP/1.1\r\n' + line)
@@ -0,0 +1,110 @@
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+from osnk.http.cache import ResponseCache, etag_matches, matching_etag
+from osnk.http.server import HTTPServer
+from .support import Served, run
+
+
+class ETagTest(unittest.TestCase):
+    def test_coding_suffix(self):
+        self.assertTrue(etag_matches('"abc"', '"abc-gzip"'))
+        self.assertTrue(etag_matches('"abc"', 'W/"abc-deflate"'))
+        self.assertTrue(etag_matches('"abc"', '"x", "abc"'))
+        self.assertTrue(etag_matches('"abc"', '*'))
+        self.assertFalse(etag_matches('"abc"', '"abcd-gzip"'))
+        self.assertFalse(etag_matches(None, '*'))
+        self.assertEqual(matching_etag('"abc"', ('"x"', '"abc-gzip"')),
+                         '"abc-gzip"')
+
+
+class CompressedCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0, compression=True)
+        self.calls = 0
+
+        @self.server.route('/doc', cache=True)
+        async def doc(request):
+            self.calls += 1
+            return 'x' * 4096
+
+    async def exchange(self, headers):
+        async with self.served.request('/doc', headers=headers,
+                                       decompress=False) as resp:
+            return resp.status, resp.headers, await resp.read()
+
+    def test_not_modified(self):
+        async def main():
+            async with Served(self.server) as self.served:
+                gzip = {'Accept-Encoding': 'gzip'}
+                status, headers, body = await self.exchange(gzip)
+                self.assertEqual(status, 200)
+                self.assertEqual(headers['Content-Encoding'], 'gzip')
+                etag = headers.get_str('ETag')
+                self.assertTrue(etag.endswith('-gzip"'))
+
+                status, headers, body = await self.exchange(
+                    dict(gzip, **{'If-None-Match': etag}))
+                self.assertEqual(status, 304)
+                self.assertEqual(headers.get_str('ETag'), etag)
+                self.assertEqual(body, b'')
+
+                status, headers, body = await self.exchange(
+                    {'If-None-Match': etag[:-len('-gzip"')] + '"'})
+                self.assertEqual(status, 304)
+
+                status, headers, body = await self.exchange(
+                    dict(gzip, **{'If-None-Match': '"other-gzip"'}))
+                self.assertEqual(status, 200)
+                self.assertEqual(self.calls, 1)
+        run(main())
+
+
+class RecordingCache(ResponseCache):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.threads = []
+
+    def _read(self, path):
+        self.threads.append(threading.get_ident())
+        return super()._read(path)
+
+
+class PathCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+        self.cache = RecordingCache(max_entry_bytes=1024)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = pathlib.Path(directory.name)
+        (self.root / 'small').write_bytes(b'x' * 100)
+        (self.root / 'large').write_bytes(os.urandom(4096))
+
+        @self.server.route('/(.*)', cache=self.cache)
+        async def files(request, name):
+            return self.root / name
+
+    def fetch(self, name, times=2):
+        async def main():
+            async with Served(self.server) as served:
+                bodies = []
+                for _ in range(times):
+                    async with served.request('/' + name) as resp:
+                        bodies.append(await resp.read())
+                return bodies
+        return run(main())
+
+    def test_large_file_is_not_read_on_loop(self):
+        data = (self.root / 'large').read_bytes()
+        self.assertEqual(self.fetch('large'), [data, data])
+        self.assertEqual(len(self.cache.entries), 0)
+        self.assertEqual(len(self.cache.threads), 2)
+        self.assertNotIn(threading.get_ident(), self.cache.threads)
+
+    def test_small_file_is_cached(self):
+        self.assertEqual(self.fetch('small'), [b'x' * 100] * 2)
+        self.assertEqual(len(self.cache.entries), 1)
+        self.assertEqual(len(self.cache.threads), 1)
+        self.assertNotIn(threading.get_ident(), self.cache.threads)
@@ -0,0 +1,72 @@
+import time
+import unittest
+from osnk.http import client
+from osnk.http.server import HTTPServer
+from .support import Served, run
+
+
+class FetchManyTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+        self.calls = 0
+
+        @self.server.route('/later')
+        async def later(request):
+            self.calls += 1
+            return None, 503, {'Retry-After': 3600}
+
+        @self.server.route('/flaky')
+        async def flaky(request):
+            self.calls += 1
+            if self.calls < 3:
+                return None, 503, {'Retry-After': 0}
+            return 'ok'
+
+    async def fetch(self, path, **options):
+        async with Served(self.server) as served:
+            return [r async for r in client.fetch_many(
+                [served.url + path], pool=served.pool, backoff=0.01,
+                **options)]
+
+    def test_long_retry_after_is_not_awaited(self):
+        started = time.monotonic()
+        (i, resp, exc), = run(self.fetch('/later', max_backoff=1))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(resp.status, 503)
+        self.assertEqual(self.calls, 1)
+
+    def test_retries(self):
+        (i, resp, exc), = run(self.fetch('/flaky'))
+        self.assertEqual((resp.status, resp.content), (200, b'ok'))
+        self.assertEqual(self.calls, 3)
+
+
+class ClientPoolTest(unittest.TestCase):
+    def test_pool_survives_closed_loop(self):
+        server = HTTPServer(host='127.0.0.1', port=0)
+        pool = client.ClientPool()
+
+        @server.route('/ping')
+        async def ping(request):
+            return 'pong'
+
+        sock = server.bind()
+        url = 'http://127.0.0.1:{}/ping'.format(sock.getsockname()[1])
+
+        async def fetch():
+            async with client.get(url, pool=pool) as resp:
+                return await resp.read()
+
+        async def main():
+            listener = await server.start(sock=sock)
+            try:
+                return await fetch()
+            finally:
+                listener.close()
+
+        self.assertEqual(run(main()), b'pong')
+        self.assertEqual(pool.stats()['idle'], 1)
+        with self.assertRaises(OSError):
+            run(fetch())
+        stats = pool.stats()
+        self.assertEqual((stats['active'], stats['idle']), (0, 0))
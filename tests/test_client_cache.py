@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+from osnk.http.cache import ClientCache
+from osnk.http.server import HTTPServer
+from .support import Served, run
+
+
+class ClientCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+
+        @self.server.route('/vary')
+        async def vary(request):
+            return request.headers.get_str('Accept'), 200, {
+                'Cache-Control': 'max-age=60', 'Vary': 'Accept'}
+
+        @self.server.route('/auth')
+        async def auth(request):
+            return request.headers.get_str('Authorization'), 200, {
+                'Cache-Control': 'max-age=60'}
+
+        @self.server.route('/doc')
+        async def doc(request):
+            return 'doc', 200, {'Cache-Control': 'max-age=60'}
+
+    async def fetch(self, served, path, cache, headers=None):
+        async with served.request(path, cache=cache,
+                                  headers=headers) as resp:
+            return await resp.read(), resp.from_cache
+
+    def test_vary(self):
+        async def main():
+            cache = ClientCache()
+            async with Served(self.server) as served:
+                a = {'Accept': 'text/a'}
+                b = {'Accept': 'text/b'}
+                self.assertEqual(await self.fetch(served, '/vary', cache, a),
+                                 (b'text/a', False))
+                self.assertEqual(await self.fetch(served, '/vary', cache, a),
+                                 (b'text/a', True))
+                self.assertEqual(await self.fetch(served, '/vary', cache, b),
+                                 (b'text/b', False))
+                self.assertEqual(await self.fetch(served, '/vary', cache, b),
+                                 (b'text/b', True))
+        run(main())
+
+    def test_authorization_bypasses_cache(self):
+        async def main():
+            cache = ClientCache()
+            async with Served(self.server) as served:
+                for token in 'A', 'B', 'A':
+                    body, from_cache = await self.fetch(
+                        served, '/auth', cache, {'Authorization': token})
+                    self.assertEqual(body, token.encode())
+                    self.assertFalse(from_cache)
+            self.assertFalse(cache.entries)
+        run(main())
+
+    def test_disk_store(self):
+        async def main():
+            with tempfile.TemporaryDirectory() as directory:
+                async with Served(self.server) as served:
+                    cache = ClientCache(directory=directory)
+                    await self.fetch(served, '/doc', cache)
+                    cache = ClientCache(directory=directory)
+                    self.assertEqual(await self.fetch(served, '/doc', cache),
+                                     (b'doc', True))
+                    await cache.clear()
+                    self.assertFalse(list(cache.store.directory.iterdir()))
+                    self.assertEqual(await self.fetch(served, '/doc', cache),
+                                     (b'doc', False))
+        run(main())
@@ -0,0 +1,139 @@
+import json
+import threading
+import unittest
+from osnk.http import codec, utils
+from osnk.http.server import HTTPServer
+from .support import Served, run
+
+
+class RecordingCodec(codec.JSONCodec):
+    def __init__(self):
+        self.threads = []
+
+    def dumps(self, obj):
+        self.threads.append(threading.get_ident())
+        return super().dumps(obj)
+
+
+class CodecTest(unittest.TestCase):
+    def codecs(self):
+        for name, (cls, module) in codec.codecs.items():
+            if module is not None:
+                yield name, cls()
+
+    def test_matches_stdlib(self):
+        for value in ({'n': 2 ** 70}, [-2 ** 64], {'x': float('nan')},
+                      [float('inf'), float('-inf'), None]):
+            for name, c in self.codecs():
+                with self.subTest(codec=name, value=value):
+                    self.assertEqual(c.dumps(value).decode(),
+                                     json.dumps(value))
+
+    def test_selection(self):
+        preferred = next(name for name in ('orjson', 'ujson', 'json')
+                         if codec.codecs[name][1] is not None)
+        self.assertEqual(codec.get_codec().name, preferred)
+        self.assertEqual(codec.get_codec('json').name, 'json')
+        c = codec.JSONCodec()
+        self.assertIs(codec.get_codec(c), c)
+        with self.assertRaises(ValueError):
+            codec.get_codec('yaml')
+        for name, (cls, module) in codec.codecs.items():
+            if module is None:
+                with self.assertRaises(ValueError):
+                    codec.get_codec(name)
+
+    def test_round_trip(self):
+        value = {'a': [1, 2.5, None, True], 'b': 'é'}
+        for name, c in self.codecs():
+            with self.subTest(codec=name):
+                data = c.dumps(value)
+                self.assertIsInstance(data, bytes)
+                self.assertEqual(c.loads(data), value)
+                self.assertEqual(c.loads(data.decode()), value)
+
+    def test_is_large(self):
+        self.assertFalse(codec.is_large({'a': 1, 'b': [1, 2, 3]}, 1000))
+        self.assertFalse(codec.is_large({str(i): i for i in range(999)},
+                                        1000))
+        self.assertTrue(codec.is_large(list(range(1000)), 1000))
+        self.assertTrue(codec.is_large(
+            {'items': [{'id': i} for i in range(600)]}, 1000))
+        self.assertTrue(codec.is_large(
+            {'data': {'rows': [[i, i] for i in range(400)]}}, 1000))
+
+
+class OffloadTest(unittest.TestCase):
+    def setUp(self):
+        self.codec = RecordingCodec()
+        self.server = HTTPServer(host='127.0.0.1', port=0, codec=self.codec)
+        self.items = {'items': [{'id': i} for i in range(5000)]}
+
+        @self.server.route('/nested')
+        async def nested(request):
+            return self.items
+
+        @self.server.route('/small')
+        async def small(request):
+            return {'id': 1}
+
+    def fetch(self, path):
+        async def main():
+            async with Served(self.server) as served:
+                async with served.request(path) as resp:
+                    return await resp.json()
+        return run(main())
+
+    def test_nested_payload_is_offloaded(self):
+        self.assertEqual(self.fetch('/nested'), self.items)
+        thread, = self.codec.threads
+        self.assertNotEqual(thread, threading.get_ident())
+
+    def test_small_payload_stays_on_loop(self):
+        self.assertEqual(self.fetch('/small'), {'id': 1})
+        self.assertEqual(self.codec.threads, [threading.get_ident()])
+
+
+class RequestJSONTest(unittest.TestCase):
+    def setUp(self):
+        self.codec = RecordingCodec()
+        self.server = HTTPServer(host='127.0.0.1', port=0, codec='json')
+        self.requests = []
+
+        @self.server.route('/echo', methods=['POST'])
+        async def echo(request):
+            self.requests.append(request)
+            return {'json': request.json, 'same': request.json is request.json}
+
+    def test_json(self):
+        async def main():
+            async with Served(self.server) as served:
+                async with served.request('/echo', method='POST',
+                                          json={'n': [1, 2]},
+                                          codec=self.codec) as resp:
+                    return await resp.json()
+        self.assertEqual(run(main()), {'json': {'n': [1, 2]}, 'same': True})
+        request, = self.requests
+        self.assertEqual(request.headers['Content-Type'], 'application/json')
+        self.assertEqual(request.codec.name, 'json')
+        self.assertEqual(len(self.codec.threads), 1)
+
+    def test_unread(self):
+        request = utils.Request(None, 'POST', ('http', 'x', 80, '/', None),
+                                None, None, utils.Body(None, 2))
+        with self.assertRaises(ValueError):
+            request.json
+        self.assertIsNone(utils.Request(None, 'GET', ('http', 'x', 80, '/',
+                                                      None), None, b'').json)
+
+
+class ResponseJSONTest(unittest.TestCase):
+    def test_large_body_is_decoded_off_loop(self):
+        c = RecordingCodec()
+        c.loads = lambda data: c.threads.append(threading.get_ident()) or \
+            json.loads(data)
+        data = json.dumps(list(range(300000))).encode()
+        response = utils.Response(None, None, 200, None, data, codec=c)
+        self.assertEqual(run(response.json()), list(range(300000)))
+        thread, = c.threads
+        self.assertNotEqual(thread, threading.get_ident())
@@ -0,0 +1,44 @@
+import unittest
+import zlib
+from osnk.http.compression import compress, decompressor
+from osnk.http.utils import Body, Response
+from .support import reader, run
+
+
+class DecompressorTest(unittest.TestCase):
+    def test_codings(self):
+        data = b'hello world ' * 100
+        for coding in 'gzip', 'deflate':
+            d = decompressor(coding)
+            self.assertEqual(d.decompress(compress(data, coding)) + d.flush(),
+                             data)
+
+    def test_raw_deflate(self):
+        c = zlib.compressobj(6, zlib.DEFLATED, -15)
+        data = b'raw deflate ' * 100
+        d = decompressor('deflate')
+        self.assertEqual(d.decompress(c.compress(data) + c.flush()) +
+                         d.flush(), data)
+
+    def test_bounded_output(self):
+        data = compress(b'\0' * (16 * 1024 * 1024), 'gzip')
+        d = decompressor('gzip')
+        sizes = [len(p) for p in d.iter_decompress(data, 65536)]
+        self.assertLessEqual(max(sizes), 65536)
+        self.assertEqual(sum(sizes) + len(d.flush()), 16 * 1024 * 1024)
+
+
+class ResponseTest(unittest.TestCase):
+    def test_iter_chunks_is_bounded(self):
+        size = 16 * 1024 * 1024
+        data = compress(b'\0' * size, 'gzip')
+
+        async def main():
+            response = Response(None, None, 200, None,
+                                body=Body(reader(data), len(data)),
+                                decoder=decompressor('gzip'))
+            return [len(c) async for c in response.iter_chunks(65536)]
+
+        sizes = run(main())
+        self.assertLessEqual(max(sizes), 65536)
+        self.assertEqual(sum(sizes), size)
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+from osnk.http.files import DirectoryIndex, run as run_in_executor
+from .support import run
+
+
+class PausedIndex(DirectoryIndex):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scanned = threading.Event()
+        self.resume = threading.Event()
+
+    def _refresh(self, path, now):
+        total = super()._refresh(path, now)
+        if not self.scanned.is_set():
+            self.scanned.set()
+            self.resume.wait(5)
+        return total
+
+
+class DirectoryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp.name)
+        (self.root / 'a.txt').write_bytes(b'abc')
+        (self.root / 'sub').mkdir()
+        (self.root / 'sub' / 'b.txt').write_bytes(b'hello')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_listing(self):
+        index = DirectoryIndex(self.root)
+        self.assertEqual(run(index.listing()), [('a.txt', 3), ('sub', 5)])
+
+    def test_symlinked_directory_is_listed(self):
+        try:
+            os.symlink(str(self.root / 'sub'), str(self.root / 'link'))
+        except (OSError, NotImplementedError):
+            self.skipTest('symlinks are not supported')
+        index = DirectoryIndex(self.root)
+        names = [name for name, size in run(index.listing())]
+        self.assertEqual(names, ['a.txt', 'link', 'sub'])
+
+    def test_invalidate_during_refresh(self):
+        index = PausedIndex(self.root, ttl=60)
+
+        async def race():
+            task = asyncio.ensure_future(index.listing())
+            await run_in_executor(None, index.scanned.wait, 5)
+            (self.root / 'c.txt').write_bytes(b'12')
+            index.invalidate(self.root / 'c.txt')
+            index.resume.set()
+            first = await task
+            second = await index.listing()
+            return first, second
+
+        first, second = run(race())
+        self.assertIn(('c.txt', 2), first)
+        self.assertIn(('c.txt', 2), second)
@@ -0,0 +1,72 @@
+import io
+import unittest
+from osnk.http.metrics import AccessLog, Histogram, Metrics
+from osnk.http.server import HTTPServer
+from .support import Served, run
+
+
+class HistogramTest(unittest.TestCase):
+    def test_cumulative(self):
+        h = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            h.observe(value)
+        self.assertEqual(list(h.cumulative()),
+                         [(0.1, 2), (1, 3), (float('inf'), 4)])
+        self.assertEqual((h.count, h.sum), (4, 2.65))
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.log = io.StringIO()
+        self.server = HTTPServer(host='127.0.0.1', port=0, metrics=True,
+                                 access_log=AccessLog(self.log))
+        self.server.expose_metrics()
+
+        @self.server.route(r'/items/(\d+)')
+        async def item(request, n):
+            return {'id': int(n)}
+
+    def exchange(self):
+        async def main():
+            async with Served(self.server) as served:
+                for path in ('/items/1', '/items/2', '/missing'):
+                    async with served.request(path) as resp:
+                        await resp.read()
+                async with served.request('/metrics') as resp:
+                    return resp.headers.get_str('Content-Type'), \
+                        (await resp.read()).decode()
+        return run(main())
+
+    def test_render(self):
+        content_type, text = self.exchange()
+        self.assertTrue(content_type.startswith('text/plain; version=0.0.4'))
+        lines = text.splitlines()
+        self.assertIn('osnk_http_requests_total{route="^/items/(\\\\d+)$",'
+                      'method="GET",status="200"} 2', lines)
+        self.assertIn('osnk_http_requests_total{route="",method="GET",'
+                      'status="404"} 1', lines)
+        self.assertIn('osnk_http_request_duration_seconds_count{'
+                      'route="^/items/(\\\\d+)$",phase="handler"} 2', lines)
+        self.assertIn('osnk_http_connections_active 1', lines)
+        self.assertIn('osnk_http_requests_inflight 1', lines)
+        self.assertIn('# TYPE osnk_client_pool_connects_total counter', lines)
+
+    def test_snapshot(self):
+        self.exchange()
+        snapshot = self.server.metrics.snapshot()
+        self.assertGreater(snapshot['bytes_in'], 0)
+        self.assertGreater(snapshot['bytes_out'], 0)
+        phases = set(x['phase'] for x in snapshot['latency']
+                     if x['route'] == r'^/items/(\d+)$')
+        self.assertEqual(phases, {'parse', 'handler', 'write', 'total'})
+
+    def test_access_log(self):
+        self.exchange()
+        lines = self.log.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn('"GET /items/1" 200', lines[0])
+        self.assertIn('"GET /missing" 404', lines[2])
+
+    def test_disabled(self):
+        with self.assertRaises(ValueError):
+            HTTPServer().expose_metrics()
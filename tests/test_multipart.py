@@ -0,0 +1,143 @@
+import unittest
+from osnk.http.multipart import MultipartParser, parse_options
+from osnk.http.server import HTTPServer
+from osnk.http.utils import BadRequest, Body, PayloadTooLarge
+from .support import Served, run
+
+BOUNDARY = 'XyZboundary'
+
+
+def encode(parts, boundary=BOUNDARY):
+    delimiter = b'--' + boundary.encode()
+    out = b'preamble\r\n'
+    for headers, data in parts:
+        out += delimiter + b'\r\n' + headers + b'\r\n\r\n' + data + b'\r\n'
+    return out + delimiter + b'--\r\nepilogue'
+
+
+def field(name, value):
+    return ('Content-Disposition: form-data; name="{}"'.format(name)
+            .encode(), value)
+
+
+def upload(name, filename, data):
+    return ('Content-Disposition: form-data; name="{}"; filename="{}"\r\n'
+            'Content-Type: application/octet-stream'.format(name, filename)
+            .encode(), data)
+
+
+class Chunks:
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size
+        self.at_eof = not data
+
+    async def read_chunk(self, size=None):
+        r, self.data = self.data[:self.size], self.data[self.size:]
+        self.at_eof = not self.data
+        return r
+
+
+def parse(data, size=65536, **options):
+    parser = MultipartParser(Chunks(data, size), BOUNDARY, **options)
+    return run(parser.parse())
+
+
+class ParseOptionsTest(unittest.TestCase):
+    def test_quoted(self):
+        self.assertEqual(
+            parse_options('form-data; name="a;b"; filename="x \\"y\\".txt"'),
+            ('form-data', {'name': 'a;b', 'filename': 'x "y".txt'}))
+
+    def test_extended(self):
+        value = ("attachment; filename=\"fallback.txt\"; "
+                 "filename*=UTF-8''%E2%82%AC.txt")
+        self.assertEqual(parse_options(value)[1]['filename'], '€.txt')
+
+    def test_boundary(self):
+        self.assertEqual(
+            parse_options('multipart/form-data; boundary=abc'),
+            ('multipart/form-data', {'boundary': 'abc'}))
+
+
+class MultipartParserTest(unittest.TestCase):
+    body = encode([field('title', 'héllo'.encode()),
+                   field('title', b'second'),
+                   upload('small', 's.txt', b'tiny\r\n--XyZ'),
+                   upload('big', 'b.bin', bytes(range(256)) * 64)])
+
+    def check(self, fields, files):
+        self.assertEqual(fields['title'], ['héllo', 'second'])
+        self.assertEqual(run(files['small'].read()), b'tiny\r\n--XyZ')
+        self.assertEqual(run(files['big'].read()), bytes(range(256)) * 64)
+        self.assertEqual(files['big'].filename, 'b.bin')
+        for name, part in files:
+            part.close()
+
+    def test_chunk_sizes(self):
+        for size in (1, 2, 3, 5, 13, 100, 4096, len(self.body)):
+            self.check(*parse(self.body, size))
+
+    def test_spill(self):
+        parser = MultipartParser(Chunks(self.body, 1000), BOUNDARY,
+                                 spool_size=1024)
+        fields, files = run(parser.parse())
+        self.assertTrue(files['big'].file._rolled)
+        self.assertFalse(files['small'].file._rolled)
+        self.check(fields, files)
+        self.assertTrue(parser.stream.at_eof)
+
+    def test_empty_part(self):
+        fields, files = parse(encode([field('empty', b'')]))
+        self.assertEqual(fields['empty'], '')
+
+    def test_buffered_body(self):
+        parser = MultipartParser(Body.buffered(self.body), BOUNDARY)
+        self.check(*run(parser.parse()))
+
+    def test_limits(self):
+        for options in ({'max_part_size': 1000}, {'max_size': 1000},
+                        {'max_field_size': 3}, {'max_parts': 2},
+                        {'max_header_size': 10}):
+            with self.assertRaises(PayloadTooLarge):
+                parse(self.body, 100, **options)
+
+    def test_truncated(self):
+        for end in (5, 40, 200, len(self.body) - 20):
+            with self.assertRaises(BadRequest):
+                parse(self.body[:end])
+
+    def test_malformed_boundary_line(self):
+        data = b'--' + BOUNDARY.encode() + b'garbage\r\n\r\nx\r\n--' + \
+            BOUNDARY.encode() + b'--'
+        with self.assertRaises(BadRequest):
+            parse(data)
+
+
+class MultipartServerTest(unittest.TestCase):
+    def test_bad_request(self):
+        server = HTTPServer(host='127.0.0.1', port=0)
+
+        @server.route('/upload', methods=['POST'], stream=True)
+        async def receive(request):
+            fields, files = await MultipartParser.from_request(
+                request).parse()
+            return {'title': fields['title']}
+
+        async def main():
+            headers = {'Content-Type': 'multipart/form-data; boundary={}'
+                       .format(BOUNDARY)}
+            body = encode([field('title', b'ok')])
+            results = []
+            async with Served(server) as served:
+                for data in body, body[:30]:
+                    async with served.request('/upload', method='POST',
+                                              data=data,
+                                              headers=headers) as resp:
+                        results.append((resp.status, await resp.read()))
+            return results
+
+        (ok, content), (bad, _) = run(main())
+        self.assertEqual(ok, 200)
+        self.assertIn(b'ok', content)
+        self.assertEqual(bad, 400)
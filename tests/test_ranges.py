@@ -0,0 +1,122 @@
+import io
+import os
+import pathlib
+import tempfile
+import unittest
+from osnk.http.ranges import (RangeStream, content_range, if_range_matches,
+                              parse_range)
+from osnk.http.utils import Headers
+from .support import run
+
+
+class ParseRangeTest(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(parse_range('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_range('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(parse_range('bytes=-200', 100), [(0, 99)])
+        self.assertEqual(parse_range('bytes=50-500', 100), [(50, 99)])
+        self.assertEqual(parse_range('Bytes = 0-0 , 2-2', 100),
+                         [(0, 0), (2, 2)])
+
+    def test_merge(self):
+        self.assertEqual(parse_range('bytes=5-9,0-4', 100), [(0, 9)])
+        self.assertEqual(parse_range('bytes=0-10,5-20,30-40', 100),
+                         [(0, 20), (30, 40)])
+        self.assertEqual(parse_range('bytes=0-1,3-4', 100), [(0, 1), (3, 4)])
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range('bytes=100-', 100), [])
+        self.assertEqual(parse_range('bytes=-0', 100), [])
+        self.assertEqual(parse_range('bytes=-5', 0), [])
+        self.assertEqual(parse_range('bytes=200-300,-0', 100), [])
+
+    def test_invalid(self):
+        for value in (None, '', 'bytes', 'items=0-1', 'bytes=', 'bytes=-',
+                      'bytes=a-b', 'bytes=5-1', 'bytes=1', 'bytes=0-1-2',
+                      'bytes=+1-2', 'bytes=0--1'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_range(value, 100))
+
+    def test_max_ranges(self):
+        value = 'bytes=' + ','.join('{0}-{0}'.format(i) for i in range(17))
+        self.assertIsNone(parse_range(value, 100))
+        self.assertEqual(len(parse_range(value, 100, max_ranges=17)), 1)
+
+
+class HeadersTest(unittest.TestCase):
+    def test_content_range(self):
+        self.assertEqual(content_range(0, 9, 100), 'bytes 0-9/100')
+
+    def test_if_range(self):
+        headers = Headers({'ETag': '"abc"',
+                           'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertTrue(if_range_matches('"abc"', headers))
+        self.assertFalse(if_range_matches('"abd"', headers))
+        self.assertFalse(if_range_matches('W/"abc"', headers))
+        self.assertTrue(if_range_matches('Wed, 21 Oct 2015 07:28:00 GMT',
+                                         headers))
+        self.assertFalse(if_range_matches('Thu, 22 Oct 2015 07:28:00 GMT',
+                                          headers))
+
+
+class RangeStreamTest(unittest.TestCase):
+    data = bytes(range(256)) * 40
+
+    async def collect(self, content, ranges, offset=0,
+                      content_type='text/plain'):
+        stream = RangeStream(content, ranges, len(self.data), offset,
+                             content_type)
+        async with stream:
+            body = b''.join([b async for b in stream])
+        return stream, body
+
+    def test_single(self):
+        stream, body = run(self.collect(io.BytesIO(self.data), [(10, 19)]))
+        self.assertIsNone(stream.parts)
+        self.assertEqual(stream.content_type, 'text/plain')
+        self.assertEqual(stream.content_length, 10)
+        self.assertEqual(body, self.data[10:20])
+
+    def test_offset(self):
+        f = io.BytesIO(b'xxx' + self.data)
+        stream, body = run(self.collect(f, [(0, 4)], offset=3))
+        self.assertEqual(body, self.data[:5])
+
+    def test_multipart_length(self):
+        for ranges in ([(0, 0), (2, 2)], [(0, 99), (200, 10239)],
+                       [(i * 100, i * 100 + 9) for i in range(16)]):
+            for content_type in ('text/plain', None):
+                with self.subTest(ranges=ranges, content_type=content_type):
+                    stream, body = run(self.collect(
+                        io.BytesIO(self.data), ranges,
+                        content_type=content_type))
+                    self.assertEqual(stream.content_length, len(body))
+                    self.check_parts(stream, body, ranges, content_type)
+
+    def check_parts(self, stream, body, ranges, content_type):
+        boundary = stream.boundary.encode()
+        self.assertEqual(stream.content_type,
+                         'multipart/byteranges; boundary=' + stream.boundary)
+        self.assertTrue(body.endswith(b'--' + boundary + b'--\r\n'))
+        parts = body.split(b'--' + boundary)[1:-1]
+        self.assertEqual(len(parts), len(ranges))
+        for part, (start, end) in zip(parts, ranges):
+            head, _, payload = part.partition(b'\r\n\r\n')
+            lines = head.split(b'\r\n')[1:]
+            expected = [b'Content-Range: ' + content_range(
+                start, end, len(self.data)).encode()]
+            if content_type:
+                expected.insert(0, b'Content-Type: text/plain')
+            self.assertEqual(lines, expected)
+            self.assertEqual(payload, self.data[start:end + 1] + b'\r\n')
+
+    def test_path(self):
+        fd, name = tempfile.mkstemp()
+        self.addCleanup(os.remove, name)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        ranges = [(0, 4), (5000, 5004)]
+        stream, body = run(self.collect(pathlib.Path(name), ranges))
+        self.assertEqual(stream.content_length, len(body))
+        self.assertTrue(stream.stream.closed)
@@ -0,0 +1,117 @@
+import re
+import unittest
+from osnk.http.router import Router
+
+
+def naive(routes, method, path):
+    for route in routes:
+        if route[0] == method:
+            m = route[1].match(path)
+            if m:
+                return route, m.groups(), True
+    found = any(r[1].match(path) for r in routes)
+    return None, (), found
+
+
+class RouterTest(unittest.TestCase):
+    patterns = [
+        ('GET', r'^/$'),
+        ('GET', r'^/users/(\d+)$'),
+        ('GET', r'^/users/(\d+)/posts/(\d+)$'),
+        ('GET', r'^/users/me$'),
+        ('GET', r'^/u(.*)$'),
+        ('GET', r'^/files/((a)|(b))/(.*)$'),
+        ('GET', r'^/colou?r$'),
+        ('GET', r'^/(?:x|y)/(z)$'),
+        ('GET', r'^/named/(?P<id>\d+)$'),
+        ('GET', r'^/twice/(\w)\1$'),
+        ('GET', re.compile(r'^/case/(\w+)$', re.IGNORECASE)),
+        ('POST', r'^/users/(\d+)$'),
+        ('POST', r'^/upload$'),
+        ('GET', r'^/users/(.*)$'),
+        ('GET', r'^/(.*)$'),
+    ]
+    paths = ['/', '/users/1', '/users/me', '/users/1/posts/22', '/users/x',
+             '/ux', '/u', '/files/a/readme', '/files/b/', '/files/c/x',
+             '/color', '/colour', '/colouur', '/x/z', '/y/z', '/named/7',
+             '/twice/aa', '/twice/ab', '/CASE/Abc', '/upload', '/', '',
+             '/unknown/deep/path']
+
+    def router(self, **options):
+        router = Router(**options)
+        for method, pattern in self.patterns:
+            if isinstance(pattern, str):
+                pattern = re.compile(pattern)
+            router.add(method, pattern, None)
+        return router
+
+    def assertResolves(self, router):
+        for method in ('GET', 'POST', 'PUT'):
+            for path in self.paths:
+                with self.subTest(method=method, path=path):
+                    self.assertEqual(router.resolve(method, path),
+                                     naive(router.routes, method, path))
+
+    def test_matches_linear_scan(self):
+        self.assertResolves(self.router())
+
+    def test_without_cache(self):
+        self.assertResolves(self.router(cache_size=0))
+
+    def test_earliest_route_wins_across_buckets(self):
+        router = Router()
+        router.add('GET', re.compile(r'^/(.*)$'), 'catchall')
+        router.add('GET', re.compile(r'^/users/(\d+)$'), 'user')
+        router.add('GET', re.compile(r'^/users/me$'), 'me')
+        route, parts, found = router.resolve('GET', '/users/1')
+        self.assertEqual((route[2], parts), ('catchall', ('users/1',)))
+        route, parts, found = router.resolve('GET', '/users/me')
+        self.assertEqual((route[2], parts), ('catchall', ('users/me',)))
+
+    def test_groups_are_offset_per_alternative(self):
+        router = Router()
+        router.add('GET', re.compile(r'^/a/(\d)(\d)$'), 'a')
+        router.add('GET', re.compile(r'^/a/(x)((y)|z)$'), 'b')
+        router.add('GET', re.compile(r'^/a/(.)$'), 'c')
+        self.assertEqual(router.resolve('GET', '/a/12')[:2][1], ('1', '2'))
+        route, parts, found = router.resolve('GET', '/a/xy')
+        self.assertEqual((route[2], parts), ('b', ('x', 'y', 'y')))
+        route, parts, found = router.resolve('GET', '/a/xz')
+        self.assertEqual((route[2], parts), ('b', ('x', 'z', None)))
+        route, parts, found = router.resolve('GET', '/a/q')
+        self.assertEqual((route[2], parts), ('c', ('q',)))
+
+    def test_prefix_bucket(self):
+        router = Router()
+        self.assertEqual(router._prefix(re.compile(r'^/users/(\d+)$')),
+                         '/users/')
+        self.assertEqual(router._prefix(re.compile(r'^/colou?r$')), '/colo')
+        self.assertEqual(router._prefix(re.compile(r'^/ab*$')), '/a')
+        self.assertEqual(router._prefix(re.compile(r'^/a{2}$')), '/')
+        self.assertEqual(router._prefix(re.compile(r'^/a|/b$')), '')
+        self.assertEqual(router._prefix(re.compile(r'/a$')), '')
+
+    def test_method_not_allowed(self):
+        router = self.router()
+        self.assertEqual(router.resolve('PUT', '/upload'), (None, (), True))
+        router = Router()
+        router.add('POST', re.compile(r'^/upload$'), None)
+        self.assertEqual(router.resolve('GET', '/other'), (None, (), False))
+
+    def test_recompiles_after_add(self):
+        router = Router()
+        router.add('GET', re.compile(r'^/a$'), 'a')
+        self.assertIsNone(router.resolve('GET', '/b')[0])
+        router.add('GET', re.compile(r'^/b$'), 'b')
+        self.assertEqual(router.resolve('GET', '/b')[0][2], 'b')
+
+    def test_many_routes(self):
+        router = Router()
+        for i in range(500):
+            router.add('GET', re.compile(r'^/r{}/(\d+)$'.format(i)), i)
+        router.add('GET', re.compile(r'^/r(\d+)/(.*)$'), 'rest')
+        for i in (0, 7, 499):
+            route, parts, found = router.resolve('GET', '/r{}/5'.format(i))
+            self.assertEqual((route[2], parts), (i, ('5',)))
+        route, parts, found = router.resolve('GET', '/r7/x')
+        self.assertEqual((route[2], parts), ('rest', ('7', 'x')))
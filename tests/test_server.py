@@ -0,0 +1,560 @@
+import asyncio
+import json
+import os
+import pathlib
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import urllib.request
+from unittest import mock
+from osnk.http.server import HTTPServer
+from .support import Served, run, send
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+
+        @self.server.route('/upload', methods=['POST'])
+        async def upload(request):
+            return {'size': len(request.content)}
+
+    def test_malformed_chunked_body(self):
+        data = send(self.server,
+                    b'POST /upload HTTP/1.1\r\nHost: x\r\n'
+                    b'Transfer-Encoding: chunked\r\n\r\nzz\r\n')
+        self.assertTrue(data.startswith(b'HTTP/1.1 400'))
+        self.assertIn(b'Connection: close', data)
+
+    def test_chunked_body(self):
+        data = send(self.server,
+                    b'POST /upload HTTP/1.1\r\nHost: x\r\n'
+                    b'Connection: close\r\n'
+                    b'Transfer-Encoding: chunked\r\n\r\n'
+                    b'5\r\nhello\r\n0\r\n\r\n')
+        self.assertTrue(data.startswith(b'HTTP/1.1 200'))
+        head, _, body = data.partition(b'\r\n\r\n')
+        self.assertEqual(json.loads(body.decode()), {'size': 5})
+
+
+class SmugglingTest(unittest.TestCase):
+    smuggled = b'GET /admin HTTP/1.1\r\nHost: x\r\n\r\n'
+
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+        self.admin = 0
+
+        @self.server.route('/upload', methods=['POST'])
+        async def upload(request):
+            return {'size': len(request.content)}
+
+        @self.server.route('/admin')
+        async def admin(request):
+            self.admin += 1
+            return 'admin'
+
+    def assertRejected(self, head, body=b''):
+        data = send(self.server,
+                    b'POST /upload HTTP/1.1\r\nHost: x\r\n' + head +
+                    b'\r\n' + body + self.smuggled)
+        self.assertTrue(data.startswith(b'HTTP/1.1 400'), data)
+        self.assertEqual(data.count(b'HTTP/1.1 '), 1)
+        self.assertIn(b'Connection: close', data)
+        self.assertEqual(self.admin, 0)
+
+    def test_invalid_content_length(self):
+        for value in (b'abc', b'1e3', b'-1', b'+5', b'0x5', b'', b'5 5'):
+            with self.subTest(value=value):
+                self.assertRejected(b'Content-Length: ' + value + b'\r\n')
+
+    def test_conflicting_content_length(self):
+        self.assertRejected(b'Content-Length: 0\r\nContent-Length: 5\r\n')
+        self.assertRejected(b'Content-Length: 0, 5\r\n')
+
+    def test_transfer_encoding_with_content_length(self):
+        self.assertRejected(b'Transfer-Encoding: chunked\r\n'
+                            b'Content-Length: 5\r\n', b'0\r\n\r\n')
+
+    def test_unsupported_transfer_encoding(self):
+        for value in (b'gzip', b'chunked, gzip', b'xchunked'):
+            with self.subTest(value=value):
+                self.assertRejected(b'Transfer-Encoding: ' + value + b'\r\n')
+
+    def test_whitespace_before_colon(self):
+        self.assertRejected(b'Content-Length : 5\r\n')
+        self.assertRejected(b'Transfer-Encoding\t: chunked\r\n')
+
+    def test_equal_content_lengths(self):
+        data = send(self.server,
+                    b'POST /upload HTTP/1.1\r\nHost: x\r\n'
+                    b'Content-Length: 5\r\nContent-Length: 5, 5\r\n\r\n'
+                    b'hello' + self.smuggled[:-4] +
+                    b'\r\nConnection: close\r\n\r\n')
+        self.assertEqual(data.count(b'HTTP/1.1 200'), 2)
+        self.assertEqual(self.admin, 1)
+
+
+class SendfileBody:
+    content_type = 'text/plain'
+
+    def __init__(self, data, content_length=None):
+        self.data = data
+        self.content_length = content_length
+        self.sent = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def sendfile(self, writer):
+        self.sent += 1
+        writer.write(self.data)
+        await writer.drain()
+
+
+class IterableSendfileBody(SendfileBody):
+    async def __aiter__(self):
+        yield self.data
+
+
+class SendfileTest(unittest.TestCase):
+    request = b'GET /body HTTP/1.1\r\nHost: x\r\n\r\n'
+    last = b'GET /body HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n'
+
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+        self.bodies = []
+
+        @self.server.route('/body')
+        async def body(request):
+            body = self.body_type(b'hello', self.length)
+            self.bodies.append(body)
+            return body
+
+    def fetch(self, body_type, length):
+        self.body_type = body_type
+        self.length = length
+        return send(self.server, self.request + self.last)
+
+    def test_sendfile_with_content_length(self):
+        for body_type in (SendfileBody, IterableSendfileBody):
+            with self.subTest(body_type=body_type.__name__):
+                self.bodies = []
+                data = self.fetch(body_type, 5)
+                self.assertEqual(data.count(b'HTTP/1.1 200'), 2)
+                self.assertEqual(data.count(b'Content-Length: 5\r\n'), 2)
+                self.assertIn(b'Connection: keep-alive', data)
+                self.assertTrue(data.endswith(b'\r\n\r\nhello'))
+                self.assertEqual([b.sent for b in self.bodies], [1, 1])
+
+    def test_sendfile_without_content_length(self):
+        data = self.fetch(SendfileBody, None)
+        head, _, body = data.partition(b'\r\n\r\n')
+        self.assertEqual(body, b'hello')
+        self.assertIn(b'Connection: close', head)
+        self.assertNotIn(b'Transfer-Encoding', head)
+        self.assertEqual([b.sent for b in self.bodies], [1])
+
+    def test_iterable_without_content_length(self):
+        data = self.fetch(IterableSendfileBody, None)
+        self.assertEqual(data.count(b'Transfer-Encoding: chunked'), 2)
+        self.assertTrue(data.endswith(b'5\r\nhello\r\n0\r\n\r\n'))
+
+
+class SlowHeadTest(unittest.TestCase):
+    request = b'GET /ping HTTP/1.1\r\nHost: x\r\n\r\n'
+
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0, head_timeout=0.3,
+                                 keep_alive_timeout=5)
+
+        @self.server.route('/ping')
+        async def ping(request):
+            return 'pong'
+
+    def drip(self, prefix):
+        async def main():
+            async with Served(self.server) as served:
+                reader, writer = await served.connect()
+                writer.write(prefix + b'GET /ping HTTP/1.1\r\n')
+                data = b''
+                try:
+                    for _ in range(50):
+                        writer.write(b'X-Slow: 1\r\n')
+                        try:
+                            chunk = await asyncio.wait_for(
+                                reader.read(65536), 0.1)
+                        except asyncio.TimeoutError:
+                            continue
+                        except ConnectionError:
+                            return data
+                        if not chunk:
+                            return data
+                        data += chunk
+                finally:
+                    writer.close()
+                self.fail('slow head was not timed out')
+        started = time.monotonic()
+        data = run(main())
+        self.assertLess(time.monotonic() - started, 2)
+        return data
+
+    def test_default(self):
+        self.assertIsNotNone(HTTPServer().head_timeout)
+
+    def test_first_request(self):
+        self.assertEqual(self.drip(b''), b'')
+
+    def test_keep_alive_request(self):
+        data = self.drip(self.request)
+        self.assertEqual(data.count(b'HTTP/1.1 200'), 1)
+        self.assertTrue(data.endswith(b'pong'))
+
+    def test_idle_keep_alive(self):
+        async def main():
+            async with Served(self.server) as served:
+                reader, writer = await served.connect()
+                try:
+                    writer.write(self.request)
+                    await reader.readuntil(b'pong')
+                    await asyncio.sleep(0.5)
+                    writer.write(self.request)
+                    return await reader.readuntil(b'pong')
+                finally:
+                    writer.close()
+        self.assertTrue(run(main()).startswith(b'HTTP/1.1 200'))
+
+
+def responses(data):
+    return [(head, body) for head, _, body in (
+        r.partition(b'\r\n\r\n') for r in data.split(b'HTTP/1.1 ')[1:])]
+
+
+class KeepAliveTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+        self.paths = []
+
+        @self.server.route('/(.*)')
+        async def echo(request, path):
+            self.paths.append(path)
+            return path
+
+    def get(self, path, version=b'1.1', *headers):
+        return b'\r\n'.join((b'GET /' + path + b' HTTP/' + version,
+                             b'Host: x') + headers + (b'', b''))
+
+    def test_pipelined(self):
+        data = send(self.server, self.get(b'a') + self.get(b'b') +
+                    self.get(b'c', b'1.1', b'Connection: close'))
+        self.assertEqual(self.paths, ['a', 'b', 'c'])
+        rs = responses(data)
+        self.assertEqual([body for head, body in rs], [b'a', b'b', b'c'])
+        self.assertEqual(
+            [b'Connection: keep-alive' in head for head, body in rs],
+            [True, True, False])
+
+    def test_connection_close(self):
+        data = send(self.server, self.get(b'a', b'1.1', b'Connection: close') +
+                    self.get(b'b'))
+        self.assertEqual(self.paths, ['a'])
+        self.assertEqual(len(responses(data)), 1)
+
+    def test_http10(self):
+        data = send(self.server, self.get(b'a', b'1.0') + self.get(b'b'))
+        self.assertEqual(self.paths, ['a'])
+        self.assertIn(b'Connection: close', data)
+        data = send(self.server,
+                    self.get(b'a', b'1.0', b'Connection: keep-alive') +
+                    self.get(b'b', b'1.0'))
+        self.assertEqual(self.paths, ['a', 'a', 'b'])
+
+    def test_max_requests(self):
+        self.server.max_requests = 2
+        data = send(self.server, self.get(b'a') + self.get(b'b') +
+                    self.get(b'c'))
+        self.assertEqual(self.paths, ['a', 'b'])
+        head, body = responses(data)[-1]
+        self.assertIn(b'Connection: close', head)
+
+    def test_idle_timeout(self):
+        self.server.keep_alive_timeout = 0.2
+        started = time.monotonic()
+        data = send(self.server, self.get(b'a'))
+        self.assertLess(time.monotonic() - started, 2)
+        (head, body), = responses(data)
+        self.assertIn(b'Connection: keep-alive', head)
+
+    def test_blank_lines_between_requests(self):
+        data = send(self.server, self.get(b'a') + b'\r\n\r\n' +
+                    self.get(b'b', b'1.1', b'Connection: close'))
+        self.assertEqual(self.paths, ['a', 'b'])
+        self.assertEqual(len(responses(data)), 2)
+
+
+class FileResponseTest(unittest.TestCase):
+    data = bytes(range(256)) * 1024
+
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = pathlib.Path(directory.name) / 'data.bin'
+        self.path.write_bytes(self.data)
+
+        @self.server.route('/path', methods=['GET', 'HEAD'])
+        async def path(request):
+            return self.path
+
+        @self.server.route('/file')
+        async def file(request):
+            f = self.path.open('rb')
+            f.seek(1000)
+            return f
+
+    def get(self, path, method=b'GET'):
+        return responses(send(self.server, method + b' ' + path +
+                              b' HTTP/1.1\r\nHost: x\r\n'
+                              b'Connection: close\r\n\r\n'))
+
+    def test_path(self):
+        (head, body), = self.get(b'/path')
+        self.assertEqual(body, self.data)
+        self.assertIn(b'Content-Length: 262144\r\n', head)
+        self.assertIn(b'Content-Type: application/octet-stream\r\n', head)
+
+    def test_loop_sendfile(self):
+        with mock.patch.object(asyncio.BaseEventLoop, 'sendfile',
+                               autospec=True,
+                               side_effect=asyncio.BaseEventLoop.sendfile) \
+                as sendfile:
+            (head, body), = self.get(b'/path')
+        self.assertEqual(body, self.data)
+        self.assertEqual(sendfile.call_count, 1)
+
+    def test_head(self):
+        (head, body), = self.get(b'/path', b'HEAD')
+        self.assertEqual(body, b'')
+        self.assertIn(b'Content-Length: 262144\r\n', head)
+
+    def test_file_object_from_offset(self):
+        (head, body), = self.get(b'/file')
+        self.assertEqual(body, self.data[1000:])
+        self.assertIn(b'Content-Length: 261144\r\n', head)
+
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+
+        @self.server.route('/async')
+        async def async_chunks(request):
+            async def chunks():
+                yield b'ab'
+                yield b''
+                yield 'cd'
+            return chunks()
+
+        @self.server.route('/sync')
+        async def sync_chunks(request):
+            return iter([b'ab', 'cd'])
+
+        @self.server.route('/empty')
+        async def empty(request):
+            return None, 204
+
+        @self.server.route('/bytes')
+        async def data(request):
+            return b'abcd'
+
+    def get(self, path, version=b'1.1'):
+        return responses(send(self.server, b'GET ' + path + b' HTTP/' +
+                              version + b'\r\nHost: x\r\n'
+                              b'Connection: close\r\n\r\n'))
+
+    def test_chunked(self):
+        for path in (b'/async', b'/sync'):
+            with self.subTest(path=path):
+                (head, body), = self.get(path)
+                self.assertIn(b'Transfer-Encoding: chunked\r\n', head)
+                self.assertNotIn(b'Content-Length', head)
+                self.assertEqual(body, b'2\r\nab\r\n2\r\ncd\r\n0\r\n\r\n')
+
+    def test_http10_is_close_delimited(self):
+        (head, body), = self.get(b'/async', b'1.0')
+        self.assertNotIn(b'Transfer-Encoding', head)
+        self.assertIn(b'Connection: close\r\n', head)
+        self.assertEqual(body, b'abcd')
+
+    def test_sized(self):
+        (head, body), = self.get(b'/bytes')
+        self.assertIn(b'Content-Length: 4\r\n', head)
+        self.assertEqual(body, b'abcd')
+
+    def test_bodyless(self):
+        (head, body), = self.get(b'/empty')
+        self.assertTrue(head.startswith(b'204'))
+        self.assertNotIn(b'Content-Length', head)
+        self.assertNotIn(b'Transfer-Encoding', head)
+        self.assertEqual(body, b'')
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'workers require os.fork()')
+class WorkersTest(unittest.TestCase):
+    def start(self, *options):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        (pathlib.Path(directory.name) / 'hello.txt').write_bytes(b'hello')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'osnk.http.server', str(self.port),
+             '-w', '2'] + list(options),
+            cwd=directory.name, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=dict(os.environ, PYTHONPATH=str(
+                pathlib.Path(__file__).resolve().parents[1])))
+        self.addCleanup(self.terminate)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                return self.get()
+            except OSError:
+                time.sleep(0.05)
+        self.fail('workers did not start')
+
+    def get(self):
+        url = 'http://127.0.0.1:{}/hello.txt'.format(self.port)
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return resp.read()
+
+    def children(self):
+        path = '/proc/{0}/task/{0}/children'.format(self.process.pid)
+        with open(path) as f:
+            return set(int(pid) for pid in f.read().split())
+
+    def wait_for(self, predicate):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if predicate():
+                return
+            time.sleep(0.05)
+        self.fail('timed out')
+
+    def terminate(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(10), 0)
+
+    def test_shared_socket(self):
+        self.assertEqual(self.start(), b'hello')
+        self.assertEqual([self.get() for _ in range(10)], [b'hello'] * 10)
+        self.stop()
+
+    @unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'),
+                         'SO_REUSEPORT is not supported')
+    def test_reuse_port(self):
+        self.assertEqual(self.start('--reuse-port'), b'hello')
+        self.stop()
+
+    @unittest.skipUnless(os.path.exists('/proc/self/task'), 'requires /proc')
+    def test_restarts_crashed_worker(self):
+        self.start()
+        self.wait_for(lambda: len(self.children()) == 2)
+        children = self.children()
+        victim = min(children)
+        os.kill(victim, signal.SIGKILL)
+        self.wait_for(lambda: len(self.children()) == 2 and
+                      victim not in self.children())
+        self.assertEqual(len(self.children() & children), 1)
+        self.assertEqual(self.get(), b'hello')
+        self.stop()
+
+
+class LimitsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(host='127.0.0.1', port=0)
+        self.release = None
+
+        @self.server.route('/upload', methods=['POST'])
+        async def upload(request):
+            return {'size': len(request.content)}
+
+        @self.server.route('/slow')
+        async def slow(request):
+            await self.release.wait()
+            return 'done'
+
+    def test_body_timeout(self):
+        self.server.body_timeout = 0.2
+        (head, body), = responses(send(
+            self.server, b'POST /upload HTTP/1.1\r\nHost: x\r\n'
+                         b'Content-Length: 10\r\n\r\nabc'))
+        self.assertTrue(head.startswith(b'408'))
+
+    def test_handler_timeout(self):
+        self.server.handler_timeout = 0.1
+
+        async def main():
+            self.release = asyncio.Event()
+            async with Served(self.server) as served:
+                return await served.raw(b'GET /slow HTTP/1.1\r\nHost: x\r\n'
+                                        b'Connection: close\r\n\r\n')
+        (head, body), = responses(run(main()))
+        self.assertTrue(head.startswith(b'503'))
+        self.assertIn(b'Retry-After: 1\r\n', head)
+
+    def test_max_inflight(self):
+        self.server.max_inflight = 1
+        request = b'GET /slow HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n'
+
+        async def main():
+            self.release = asyncio.Event()
+            async with Served(self.server) as served:
+                first = asyncio.ensure_future(served.raw(request))
+                while not self.server.inflight:
+                    await asyncio.sleep(0.01)
+                shed = await served.raw(request)
+                self.release.set()
+                return await first, shed
+        (first, shed) = run(main())
+        self.assertTrue(first.startswith(b'HTTP/1.1 200'))
+        self.assertTrue(shed.startswith(b'HTTP/1.1 503'))
+        self.assertIn(b'Retry-After: 1\r\n', shed)
+
+    def test_max_connections(self):
+        self.server.max_connections = 1
+        request = b'GET /slow HTTP/1.1\r\nHost: x\r\n\r\n'
+
+        async def main():
+            self.release = asyncio.Event()
+            self.release.set()
+            async with Served(self.server) as served:
+                reader1, writer1 = await served.connect()
+                writer1.write(request)
+                await reader1.readuntil(b'done')
+                reader2, writer2 = await served.connect()
+                writer2.write(request)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(reader2.readuntil(b'done'), 0.3)
+                writer1.close()
+                try:
+                    return await asyncio.wait_for(
+                        reader2.readuntil(b'done'), 5)
+                finally:
+                    writer2.close()
+        self.assertTrue(run(main()).startswith(b'HTTP/1.1 200'))
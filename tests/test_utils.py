@@ -0,0 +1,204 @@
+import email.utils
+import io
+import unittest
+from unittest import mock
+from osnk.http import utils
+from .support import run
+
+
+class HttpDateTest(unittest.TestCase):
+    def test_format(self):
+        self.assertEqual(utils.http_date(0), 'Thu, 01 Jan 1970 00:00:00 GMT')
+        self.assertEqual(utils.http_date(784111777.9),
+                         'Sun, 06 Nov 1994 08:49:37 GMT')
+
+    def test_timestamps_do_not_evict_current_date(self):
+        formatdate = mock.Mock(wraps=email.utils.formatdate)
+        with mock.patch('time.time', return_value=1e9), \
+                mock.patch.object(email.utils, 'formatdate', formatdate):
+            now = utils.http_date()
+            for _ in range(3):
+                self.assertEqual(utils.http_date(0),
+                                 'Thu, 01 Jan 1970 00:00:00 GMT')
+                self.assertEqual(utils.http_date(), now)
+        self.assertEqual(now, 'Sun, 09 Sep 2001 01:46:40 GMT')
+        self.assertEqual(formatdate.call_count, 4)
+
+
+class Transport:
+    def __init__(self, ssl):
+        self.ssl = ssl
+
+    def get_extra_info(self, name, default=None):
+        return object() if name == 'sslcontext' and self.ssl else default
+
+
+class Writer:
+    def __init__(self, ssl=True):
+        self.transport = Transport(ssl)
+        self.data = bytearray()
+        self.drains = 0
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        self.drains += 1
+
+
+class SendfileTest(unittest.TestCase):
+    def test_buffered_fallback(self):
+        writer = Writer()
+        f = io.BytesIO(bytes(range(256)) * 10)
+        sent = run(utils.sendfile(writer, f, 100, 1000, chunk_size=300))
+        self.assertEqual(sent, 1000)
+        self.assertEqual(bytes(writer.data), f.getvalue()[100:1100])
+        self.assertEqual(writer.drains, 4)
+
+    def test_to_end(self):
+        writer = Writer()
+        f = io.BytesIO(b'abcdef')
+        self.assertEqual(run(utils.sendfile(writer, f, 2)), 4)
+        self.assertEqual(bytes(writer.data), b'cdef')
+
+
+class ContentStreamTest(unittest.TestCase):
+    def read(self, content):
+        async def main():
+            async with utils.ContentStream(content) as stream:
+                return stream, [b async for b in stream]
+        return run(main())
+
+    def test_sized(self):
+        for content, expected in (('é', b'\xc3\xa9'), (b'ab', b'ab'),
+                                  (bytearray(b'ab'), b'ab'),
+                                  ({'a': 1}, None), (None, b'')):
+            with self.subTest(content=content):
+                stream, chunks = self.read(content)
+                if expected is not None:
+                    self.assertEqual(b''.join(chunks), expected)
+                self.assertEqual(stream.content_length,
+                                 len(b''.join(chunks)))
+
+    def test_iterators(self):
+        async def agen():
+            yield b'a'
+            yield 'b'
+
+        for content in (agen(), iter([b'a', 'b']), (x for x in 'ab')):
+            with self.subTest(content=content):
+                stream, chunks = self.read(content)
+                self.assertIsNone(stream.content_length)
+                self.assertEqual(chunks, [b'a', b'b'])
+
+    def test_content_attributes(self):
+        class Chunks:
+            content_type = 'text/csv'
+            content_length = 2
+
+            async def __aiter__(self):
+                yield b'ab'
+
+        stream = utils.ContentStream(Chunks())
+        self.assertEqual((stream.content_type, stream.content_length),
+                         ('text/csv', 2))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            utils.ContentStream(object())
+
+
+class ParseHeadTest(unittest.TestCase):
+    head = (b'GET /a?b=1 HTTP/1.1\r\nHost: example.com\r\n'
+            b'Content-Length: 012\r\nX-Ratio: 1.5\r\nAccept: a\r\n'
+            b'accept: b\r\nX-Empty:\r\nX-Spaced:  v  \r\n')
+
+    def test_start_line(self):
+        start, headers = utils.parse_head(self.head)
+        self.assertEqual(start, ['GET', '/a?b=1', 'HTTP/1.1'])
+        start, headers = utils.parse_head(b'HTTP/1.1 404 Not Found\r\n'
+                                          b'Content-Length: 0')
+        self.assertEqual(start, ['HTTP/1.1', '404', 'Not Found'])
+
+    def test_headers(self):
+        start, headers = utils.parse_head(self.head)
+        self.assertEqual(headers['host'], 'example.com')
+        self.assertEqual(headers['Accept'], ('a', 'b'))
+        self.assertEqual(headers['X-Empty'], '')
+        self.assertEqual(headers.get_str('X-Spaced'), 'v')
+        self.assertIsNone(headers['Missing'])
+        self.assertEqual([name for name, value in headers],
+                         ['Host', 'Content-Length', 'X-Ratio', 'Accept',
+                          'Accept', 'X-Empty', 'X-Spaced'])
+
+    def test_lazy_coercion(self):
+        start, headers = utils.parse_head(self.head)
+        self.assertIsNone(headers._typed)
+        self.assertEqual(headers.get_str('Content-Length'), '012')
+        self.assertIsNone(headers._typed)
+        self.assertEqual(headers['Content-Length'], 12)
+        self.assertEqual(headers['X-Ratio'], 1.5)
+        self.assertEqual(set(headers._typed), {'content-length', 'x-ratio'})
+        self.assertEqual(headers.get_int('Content-Length'), 12)
+        self.assertIsNone(headers.get_int('X-Ratio'))
+        headers['Content-Length'] = '7'
+        self.assertEqual(headers['Content-Length'], '7')
+        self.assertEqual(set(headers._typed), {'x-ratio'})
+
+    def test_charset(self):
+        start, headers = utils.parse_head(
+            'GET / HTTP/1.1\r\nX-Name: é'.encode('latin-1'), 'latin-1')
+        self.assertEqual(headers['X-Name'], 'é')
+
+
+class SlotsTest(unittest.TestCase):
+    def test_no_instance_dict(self):
+        for obj in (utils.Headers({'a': 1}), utils.Arguments({'a': ['1']}),
+                    utils.Request(None, 'GET', ('http', 'x', 80, '/'), None,
+                                  b''),
+                    utils.Response(None, None, 200, None, b'')):
+            with self.subTest(cls=type(obj).__name__):
+                self.assertFalse(hasattr(obj, '__dict__'))
+                with self.assertRaises(AttributeError):
+                    obj.extra = 1
+
+    def test_url_is_padded(self):
+        request = utils.Request(None, 'GET', ['http', 'x', 80], None, b'')
+        self.assertEqual(request.url, ('http', 'x', 80, None, None))
+        url = ('http', 'x', 80, '/', 'a=1')
+        self.assertIs(utils.Request(None, 'GET', url, None, b'').url, url)
+
+    def test_args_are_lazy(self):
+        request = utils.Request(None, 'GET', ('http', 'x', 80, '/', 'a=1&a=2'),
+                                None, b'')
+        self.assertFalse(hasattr(request, '_args'))
+        self.assertEqual(request.args['a'], ['1', '2'])
+        self.assertIs(request.args, request._args)
+
+
+class HeadersCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.original = utils.parse_head(
+            b'GET / HTTP/1.1\r\nContent-Length: 5\r\nX-A: 1')[1]
+        self.original['Content-Length']
+        self.copy = utils.Headers(self.original)
+
+    def test_shares_until_modified(self):
+        self.assertIs(self.copy._keyvals, self.original._keyvals)
+        self.assertEqual(self.copy['content-length'], 5)
+
+    def test_modify_copy(self):
+        self.copy['X-A'] = 'b'
+        self.copy['X-B'] = 'c'
+        del self.copy['Content-Length']
+        self.assertEqual(self.original['X-A'], 1)
+        self.assertNotIn('X-B', self.original)
+        self.assertEqual(self.original['Content-Length'], 5)
+        self.assertEqual(self.copy['X-A'], 'b')
+
+    def test_modify_original(self):
+        self.original['X-A'] = 'b'
+        del self.original['Content-Length']
+        self.assertEqual(self.copy['X-A'], 1)
+        self.assertEqual(self.copy['Content-Length'], 5)
+        self.assertEqual(self.original['X-A'], 'b')